@@ -1,6 +1,83 @@
 """
 Jobs utility classes.
 """
+import time
+
+
+class LocalCache(dict):
+    """
+    A dictionary kept in each process that's emptied whenever any process
+    invalidates it.
+
+    Processes are kept in step by a generation number stored in Django's
+    cache: invalidate bumps the number, and validate empties the dictionary
+    if the number changed since it was last checked. So that validating
+    before every lookup stays cheap, the number is checked at most once
+    every ``interval`` seconds (the JOBS_LOCAL_CACHE_INTERVAL setting, one
+    second by default), and other processes can see invalidated values for
+    that long.
+    """
+    def __init__(self, name, interval=None):
+        super(LocalCache, self).__init__()
+        self.key = "jobs_local_cache_%s" % name
+        self.generation = None
+        self.interval = interval
+        self.checked = 0
+
+    def validate(self):
+        """
+        Empties the dictionary if it was invalidated since the number was last
+        checked.
+        """
+        from django.conf import settings
+        from django.core.cache import cache
+
+        interval = self.interval
+        if interval is None:
+            interval = getattr(settings, "JOBS_LOCAL_CACHE_INTERVAL", 1)
+        now = time.time()
+        if now - self.checked < interval:
+            return
+        self.checked = now
+
+        generation = cache.get(self.key)
+        if generation is None:
+            generation = 0
+            cache.add(self.key, generation, 60 * 60 * 24 * 30)
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+
+    def invalidate(self):
+        """
+        Empties the dictionary in this process and every other one.
+        """
+        from django.core.cache import cache
+
+        self.clear()
+        try:
+            self.generation = cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, 1, 60 * 60 * 24 * 30)
+            self.generation = 1
+
+
+class FormPlan(object):
+    """
+    Everything needed to build a component's forms: its parts in order, each
+    with its content type, form class and whether that form takes files.
+    """
+    class Part(object):
+        def __init__(self, component_part, content_type, form_class, is_multipart):
+            self.component_part = component_part
+            self.content_type = content_type
+            self.form_class = form_class
+            self.is_multipart = is_multipart
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.is_multipart = any(part.is_multipart for part in parts)
+
 
 class ComponentRegistry(dict):
     """
@@ -22,6 +99,10 @@ class ComponentRegistry(dict):
         """
         pass
 
+    def __init__(self, *args, **kwargs):
+        super(ComponentRegistry, self).__init__(*args, **kwargs)
+        self.plans = LocalCache("component_form_plans")
+
     def register(self, app_label, model, value):
         """
         Stores a dictionary of values for each app_label, creating a new
@@ -48,4 +129,24 @@ class ComponentRegistry(dict):
         else:
             return value
 
+    def get_form_plan(self, component):
+        """
+        Returns the FormPlan for the component, from the per-process plan
+        cache or built with one query.
+        """
+        self.plans.validate()
+        plan = self.plans.get(component.id)
+        if plan is None:
+            parts = []
+            for component_part in component.componentpart_set.select_related("content_type"):
+                content_type = component_part.content_type
+                form_class = self.get(content_type.app_label).get(content_type.model)
+                # Ask an instance, so fields added in the form's __init__
+                # are counted.
+                is_multipart = form_class().is_multipart()
+                parts.append(FormPlan.Part(component_part, content_type, form_class, is_multipart))
+            plan = self.plans[component.id] = FormPlan(parts)
+        return plan
+
+
 registry = ComponentRegistry()
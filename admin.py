@@ -4,7 +4,7 @@ from wwu_housing.jobs.models import (AdminApplication, Applicant,
                                      Application, ApplicationComponentPart,
                                      ApplicationEmail, ApplicationStatus,
                                      Component, ComponentPart, Date, Job,
-                                     JobUser, Qualification)
+                                     JobUser, OutboxMessage, Qualification)
 
 
 class ComponentInline(admin.TabularInline):
@@ -83,3 +83,8 @@ class QualificationAdmin(admin.ModelAdmin):
     pass
 admin.site.register(Qualification, QualificationAdmin)
 
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("subject", "to", "created_datetime", "sent_datetime", "attempts")
+    list_filter = ("sent_datetime",)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
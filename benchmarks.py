@@ -0,0 +1,225 @@
+"""
+Synthetic data and measurements for benchmarking the jobs views.
+
+``build_job`` saves a copy of a job with any number of components, parts and
+applicants, and ``measure`` requests a view with the test client and records
+its wall time, number of queries and peak memory. See the benchmark_views
+management command and the query budget tests.
+"""
+from __future__ import with_statement
+
+import copy
+import datetime
+import resource
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template.defaultfilters import slugify
+
+from models import (AdminApplication, Applicant, Application,
+                    ApplicationComponentPart, ApplicationStatus, Component,
+                    ComponentPart)
+from utils import _persons
+
+# Queries every page runs for a logged in user: the session, the user and the
+# user's legacy messages, plus one spare for the project's base template.
+REQUEST_QUERIES = 4
+
+# Views whose number of queries mustn't grow with the number of applicants,
+# with the most queries each may run for a superuser once the per-process
+# caches are warm. Each budget is REQUEST_QUERIES plus the view's own queries,
+# counted from its code for a job built by build_job (whose applications
+# aren't submitted and whose parts have no questions or responses).
+CONSTANT_QUERY_VIEWS = dict((name, queries + REQUEST_QUERIES) for name, queries in [
+    # The user's applications.
+    ("jobs_index", 1),
+    # The user's application for the job.
+    ("job", 1),
+    # The job, the page of ids, the page's applications, admin statuses,
+    # interviews and comments, and the count.
+    ("admin", 7),
+    # The job, the application and its responses.
+    ("applicant", 3),
+    # The job, the chunk of applications and its interviews, and the empty
+    # chunk that ends the export.
+    ("create_admin_csv", 4),
+    # The job, its component parts and the empty chunk of submitted
+    # applications.
+    ("export_application", 3),
+])
+
+
+class SyntheticAddress(object):
+    def __init__(self, street_line_1, type="MA"):
+        self.type = type
+        self.street_line_1 = street_line_1
+        self.street_line_2 = ""
+        self.street_line_3 = ""
+        self.city = "Bellingham"
+        self.state = "WA"
+        self.zip_code = "98225"
+
+
+class SyntheticPerson(object):
+    """
+    Stands in for a person from the student records database, with the
+    attributes the jobs views use.
+    """
+    def __init__(self, username, index):
+        self.username = username
+        self.student_id = "W%08d" % index
+        self.first_name = "First%d" % index
+        self.last_name = "Last%d" % index
+        self.email = "%s@example.com" % username
+        self.gender = index % 2 and "F" or "M"
+        self.ethnicity = ""
+        self.gpa = "3.%d" % (index % 10)
+        self.addresses = [SyntheticAddress("%d Highland Drive" % index)]
+
+    def get_address_by_type(self, type):
+        for address in self.addresses:
+            if address.type == type:
+                return address
+        return None
+
+
+def build_job(template, components=5, parts=4, applicants=50,
+              prefix="benchmark", make_response=None):
+    """
+    Saves and returns a posted and open copy of ``template`` (e.g. a fixture
+    job) with ``components`` components of ``parts`` parts each and
+    ``applicants`` applicants, each of whom has started an application with
+    every part.
+
+    Applicants get users named ``<prefix>-<n>`` and synthetic persons in the
+    person cache, so the views don't need the student records database.
+    Responses have no content objects unless ``make_response`` is given; it's
+    called with an application and a component part and returns the model
+    instance to use as the response.
+    """
+    now = datetime.datetime.now()
+    job = copy.copy(template)
+    job.id = None
+    job.slug = "%s-%s" % (prefix, slugify(template.title))
+    job.post_datetime = job.open_datetime = now - datetime.timedelta(days=1)
+    job.deadline = now + datetime.timedelta(days=1)
+    job.close_datetime = now + datetime.timedelta(days=2)
+    job.save()
+
+    component_parts = []
+    for component_index in xrange(components):
+        component = Component.objects.create(job=job,
+                                             name="%s component %d" % (prefix, component_index),
+                                             sequence_number=component_index)
+        for part_index in xrange(parts):
+            component_parts.append(ComponentPart.objects.create(component=component,
+                                                                sequence_number=part_index))
+
+    status, created = ApplicationStatus.objects.get_or_create(status=u"In Progress")
+    ApplicationStatus.objects.get_or_create(status=u"Submitted")
+    for index in xrange(applicants):
+        username = "%s-%d" % (prefix, index)
+        user = User.objects.create(username=username, first_name="First%d" % index,
+                                   last_name="Last%d" % index)
+        _persons.set(username, SyntheticPerson(username, index))
+        applicant = Applicant.objects.create(user=user)
+        application = Application.objects.create(applicant=applicant, job=job)
+        AdminApplication.objects.create(application=application, status=status)
+        for component_part in component_parts:
+            application_component_part = ApplicationComponentPart(application=application,
+                                                                  component_part=component_part)
+            if make_response:
+                application_component_part.content_object = make_response(application, component_part)
+            application_component_part.save()
+    return job
+
+
+def get_view_paths(job, username):
+    """
+    Returns a list of ``(view name, path)`` pairs for the views to measure,
+    using ``username``'s application for the applicant view.
+    """
+    return [
+        ("jobs_index", reverse("jobs_index")),
+        ("job", reverse("jobs_job", args=[job.slug])),
+        ("admin", reverse("jobs_job_admin", args=[job.slug])),
+        ("applicant", reverse("jobs_job_admin_applicant", args=[job.slug, username])),
+        ("create_admin_csv", reverse("jobs_job_admin_csv", args=[job.slug])),
+        ("export_application", reverse("jobs_job__export_application", args=[job.slug])),
+    ]
+
+
+class QueryCounter(object):
+    """
+    Records the queries run inside a ``with`` block.
+
+    This version of Django only records queries when DEBUG is on, so DEBUG is
+    turned on for the block.
+    """
+    def __enter__(self):
+        self.debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        self.queries = []
+        return self
+
+    def __exit__(self, *exc_info):
+        self.queries = connection.queries
+        connection.queries = []
+        settings.DEBUG = self.debug
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def _get_peak_memory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(client, path, warm=True):
+    """
+    Requests ``path`` with the test client and returns a dictionary of the
+    response's status code, the wall time in seconds, the number of queries,
+    and the process's peak resident memory and its growth during the request
+    in kilobytes.
+
+    With ``warm``, the path is requested once first so per-process caches are
+    loaded before the measured request.
+    """
+    if warm:
+        client.get(path).content
+    peak_memory = _get_peak_memory()
+    started = time.time()
+    counter = QueryCounter()
+    with counter:
+        response = client.get(path)
+        # Read the content inside the block so streamed responses are counted.
+        response.content
+    return {"status_code": response.status_code,
+            "seconds": time.time() - started,
+            "queries": len(counter),
+            "peak_memory": _get_peak_memory(),
+            "memory_growth": _get_peak_memory() - peak_memory}
+
+
+def run_benchmarks(client, template, scales, prefix="benchmark"):
+    """
+    Builds a job for each ``(components, parts, applicants)`` scale and
+    measures every view for it with ``client``, which should be logged in as
+    a superuser. Returns a list of ``(scale, view name, measurement)``
+    tuples.
+    """
+    jobs = []
+    for index, (components, parts, applicants) in enumerate(scales):
+        scale_prefix = "%s%d" % (prefix, index)
+        jobs.append((build_job(template, components, parts, applicants, scale_prefix),
+                     "%s-0" % scale_prefix))
+
+    results = []
+    for scale, (job, username) in zip(scales, jobs):
+        for name, path in get_view_paths(job, username):
+            results.append((scale, name, measure(client, path)))
+    return results
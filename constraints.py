@@ -0,0 +1,209 @@
+"""
+Declarative constraints for reviewer assignment.
+
+Constraints are rules that can be passed to ``utils.assign_reviewers`` like
+any other rule function. When every rule is a constraint, the "vectorized"
+strategy compiles them into NumPy arrays (an applicants by reviewers
+eligibility matrix and a vector of reviewer capacities) so the assignment is
+worked out with array operations rather than a rule call per applicant,
+reviewer and try.
+
+NumPy is only needed for the "vectorized" strategy.
+"""
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _get_getter(value):
+    """
+    Returns ``value`` if it's callable, otherwise a function that gets the
+    attribute named ``value``.
+    """
+    if callable(value):
+        return value
+    return operator.attrgetter(value)
+
+
+class Constraint(object):
+    """
+    Base class for constraints. Calling a constraint with a reviewer, an
+    applicant and the reviewer's current applicants works like any other rule.
+    """
+    def __call__(self, reviewer, applicant, current_applicants):
+        raise NotImplementedError
+
+    def compile(self, problem):
+        """
+        Applies the constraint to the problem's arrays.
+        """
+        raise NotImplementedError
+
+
+class Capacity(Constraint):
+    """
+    Assigns at most ``limit`` applicants to each reviewer.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+
+    def __call__(self, reviewer, applicant, current_applicants):
+        return len(current_applicants) < self.limit
+
+    def compile(self, problem):
+        problem.capacity = numpy.minimum(problem.capacity, self.limit)
+
+
+class Exclude(Constraint):
+    """
+    Keeps applicants away from reviewers. ``get_excluded`` takes an applicant
+    and returns the reviewers who can't review them.
+    """
+    def __init__(self, get_excluded):
+        self.get_excluded = get_excluded
+
+    def __call__(self, reviewer, applicant, current_applicants):
+        return reviewer not in self.get_excluded(applicant)
+
+    def compile(self, problem):
+        for applicant_index, applicant in enumerate(problem.applicants):
+            for reviewer in self.get_excluded(applicant):
+                reviewer_index = problem.reviewer_indexes.get(problem.get_reviewer_key(reviewer))
+                if reviewer_index is not None:
+                    problem.eligible[applicant_index, reviewer_index] = False
+
+
+class _AttributeConstraint(Constraint):
+    def __init__(self, reviewer_attribute, applicant_attribute):
+        self.get_reviewer_value = _get_getter(reviewer_attribute)
+        self.get_applicant_value = _get_getter(applicant_attribute)
+
+    def _encode(self, problem):
+        # Number the distinct values so they can be compared as integers.
+        codes = {}
+        reviewer_values = numpy.array([
+            codes.setdefault(self.get_reviewer_value(reviewer), len(codes))
+            for reviewer in problem.reviewers
+        ], dtype=int)
+        applicant_values = numpy.array([
+            codes.setdefault(self.get_applicant_value(applicant), len(codes))
+            for applicant in problem.applicants
+        ], dtype=int)
+        return numpy.equal.outer(applicant_values, reviewer_values)
+
+
+class AttributeEqual(_AttributeConstraint):
+    """
+    Only lets a reviewer review applicants whose value matches the
+    reviewer's, e.g. ``AttributeEqual("hall", "hall")``. Attributes may be
+    given as names or as functions that take a reviewer or an applicant.
+    """
+    def __call__(self, reviewer, applicant, current_applicants):
+        return self.get_reviewer_value(reviewer) == self.get_applicant_value(applicant)
+
+    def compile(self, problem):
+        problem.eligible &= self._encode(problem)
+
+
+class AttributeNotEqual(_AttributeConstraint):
+    """
+    Only lets a reviewer review applicants whose value differs from the
+    reviewer's, e.g. ``AttributeNotEqual("hall", "hall")`` keeps reviewers
+    from reviewing applicants who live in their hall.
+    """
+    def __call__(self, reviewer, applicant, current_applicants):
+        return self.get_reviewer_value(reviewer) != self.get_applicant_value(applicant)
+
+    def compile(self, problem):
+        problem.eligible &= ~self._encode(problem)
+
+
+class ReviewersPerApplicant(Constraint):
+    """
+    Assigns each applicant to ``count`` different reviewers.
+    """
+    def __init__(self, count):
+        self.count = count
+
+    def __call__(self, reviewer, applicant, current_applicants):
+        return applicant not in current_applicants
+
+    def compile(self, problem):
+        problem.reviewers_per_applicant = max(problem.reviewers_per_applicant, self.count)
+
+
+class Problem(object):
+    """
+    The arrays a set of constraints compiles to.
+    """
+    def __init__(self, reviewers, applicants, get_reviewer_key):
+        self.reviewers = list(reviewers)
+        self.applicants = list(applicants)
+        self.get_reviewer_key = get_reviewer_key
+        self.reviewer_indexes = dict((get_reviewer_key(reviewer), index)
+                                     for index, reviewer in enumerate(self.reviewers))
+        self.eligible = numpy.ones((len(self.applicants), len(self.reviewers)), dtype=bool)
+        self.capacity = numpy.empty(len(self.reviewers), dtype=int)
+        self.capacity.fill(len(self.applicants))
+        self.reviewers_per_applicant = 1
+
+
+def assign_vectorized(reviewers, applicants, constraints, get_reviewer_key):
+    """
+    Assigns applicants to reviewers so that all the constraints are met,
+    returning a dictionary like ``utils.assign_reviewers``.
+
+    Each applicant goes to the least loaded eligible reviewer. If there is
+    none, already assigned applicants are moved to make room where possible
+    (an augmenting path search), so an applicant is only left unassigned when
+    no valid assignment exists.
+    """
+    if numpy is None:
+        raise ImportError("The vectorized reviewer assignment strategy requires NumPy.")
+
+    problem = Problem(reviewers, applicants, get_reviewer_key)
+    for constraint in constraints:
+        constraint.compile(problem)
+    eligible = problem.eligible
+    capacity = problem.capacity
+    assigned = numpy.zeros(eligible.shape, dtype=bool)
+    load = numpy.zeros(len(problem.reviewers), dtype=int)
+    unloaded = len(problem.applicants) + 1
+
+    def augment(applicant_index, visited):
+        candidates = eligible[applicant_index] & ~assigned[applicant_index] & ~visited
+        open_candidates = candidates & (load < capacity)
+        if open_candidates.any():
+            reviewer_index = numpy.where(open_candidates, load, unloaded).argmin()
+            visited[reviewer_index] = True
+            assigned[applicant_index, reviewer_index] = True
+            load[reviewer_index] += 1
+            return True
+        for reviewer_index in numpy.flatnonzero(candidates):
+            visited[reviewer_index] = True
+            for other_index in numpy.flatnonzero(assigned[:, reviewer_index]):
+                assigned[other_index, reviewer_index] = False
+                if augment(other_index, visited):
+                    assigned[applicant_index, reviewer_index] = True
+                    return True
+                assigned[other_index, reviewer_index] = True
+        return False
+
+    unassigned = []
+    for round in xrange(problem.reviewers_per_applicant):
+        for applicant_index, applicant in enumerate(problem.applicants):
+            if not augment(applicant_index, numpy.zeros(len(problem.reviewers), dtype=bool)):
+                unassigned.append(applicant)
+
+    assignments = {}
+    for reviewer_index, reviewer in enumerate(problem.reviewers):
+        assignments[get_reviewer_key(reviewer)] = [
+            problem.applicants[applicant_index]
+            for applicant_index in numpy.flatnonzero(assigned[:, reviewer_index])
+        ]
+    if unassigned:
+        assignments["_UNASSIGNED"] = unassigned
+    return assignments
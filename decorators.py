@@ -0,0 +1,23 @@
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.functional import wraps
+
+from models import Job
+from permissions import get_role
+
+
+def job_role_required(view):
+    """
+    Decorator for job admin views. Loads the job for the view's ``job_slug``
+    argument and the user's role for it, and calls the view with the job and
+    the role in place of the slug. Users without a role get a 401 response.
+    """
+    def wrapper(request, job_slug, *args, **kwargs):
+        job = get_object_or_404(Job.objects.all(), slug=job_slug)
+        role = get_role(request, job)
+        if role is None:
+            return HttpResponse(content="401 Unauthorized: Access is denied due to invalid credentials.",
+                                mimetype="text/plain", status=401)
+        return view(request, job, role, *args, **kwargs)
+    return login_required(wraps(view)(wrapper))
@@ -0,0 +1,191 @@
+"""
+CSV exports of a job's applications.
+
+Rows are produced by generators that walk the applications in chunks, loading
+everything a chunk needs in bulk, so an export's memory use doesn't grow with
+the number of applicants.
+"""
+import csv
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from wwu_housing.wwu_jobs.models import Interview
+
+from models import ApplicationComponentPart, ComponentPart
+from responses import get_response_type, prefetch_responses
+from utils import _get_persons_for_applications, load_content_objects, prefetch_content_objects
+
+CHUNK_SIZE = 200
+
+
+class _Echo(object):
+    """
+    File-like object whose write method returns what it's given so csv.writer
+    can be used to format lines one at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of at most ``chunk_size`` instances from the queryset in
+    primary key order, using the last key seen to fetch each following chunk.
+    """
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by("id")[:chunk_size])
+        if not chunk:
+            break
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def csv_lines(rows):
+    """Yields each row formatted as a line of CSV."""
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(rows, filename, stream=None):
+    """
+    Returns a CSV attachment response for the rows.
+
+    When ``stream`` is true (the default is the JOBS_STREAM_EXPORTS setting,
+    itself true by default) the response is built from a generator and lines
+    are written as they're produced. Middleware that reads response.content
+    will consume the generator, so turn streaming off when using it.
+    """
+    if stream is None:
+        stream = getattr(settings, "JOBS_STREAM_EXPORTS", True)
+    lines = csv_lines(rows)
+    if not stream:
+        lines = "".join(lines)
+    response = HttpResponse(lines, mimetype="text/csv")
+    response["Content-Disposition"] = 'attachment; filename=%s' % filename
+    return response
+
+
+def _format_mailing_address(person):
+    address = person.get_address_by_type("MA")
+    if not address:
+        return ""
+    mailing_address = address.street_line_1
+    if address.street_line_2:
+        mailing_address = mailing_address + " " + address.street_line_2
+    if address.street_line_3:
+        mailing_address = mailing_address + " " + address.street_line_3
+    return "%s %s, %s %s" % (mailing_address, address.city,
+                             address.state, address.zip_code)
+
+
+def admin_csv_rows(job, chunk_size=CHUNK_SIZE):
+    """
+    Yields the header and one row per started application for the job's admin
+    CSV export.
+    """
+    yield ["Student ID", "First Name", "Last Name", "Gender",
+           "Email", "Address", "GPA", "Ethnicity", "Status",
+           "Interview Location", "Interview Date"]
+
+    applications = job.application_set.with_status().filter(
+        applicationcomponentpart__isnull=False
+    ).distinct().select_related("applicant__user")
+    for chunk in iter_chunks(applications, chunk_size):
+        persons = _get_persons_for_applications(chunk)
+        interviews = dict(
+            (interview.application_id, interview)
+            for interview in Interview.objects.filter(job=job, application__in=chunk)
+        )
+
+        for application in chunk:
+            person = persons[application.applicant.user.username]
+            interview = interviews.get(application.id)
+            if interview:
+                interview_location = interview.location
+                interview_date = interview.datetime.strftime("%A, %B %e at %I:%M %p")
+            else:
+                interview_location = "None"
+                interview_date = "None"
+
+            yield [person.student_id, person.first_name,
+                   person.last_name, person.gender, person.email,
+                   _format_mailing_address(person), person.gpa,
+                   person.ethnicity, application.status, interview_location,
+                   interview_date]
+
+
+def application_export_rows(job, chunk_size=CHUNK_SIZE):
+    """
+    Yields the header and one row per submitted application for the job's
+    application export, with a column for each of the job's component parts.
+
+    Each chunk of applications loads its application component parts with one
+    query and their responses with one query per content type, then fills in
+    the rows a column at a time.
+    """
+    component_parts = list(ComponentPart.objects.filter(
+        component__job=job
+    ).select_related("component").order_by(
+        "component__sequence_number", "component", "sequence_number"
+    ))
+    prefetch_content_objects(component_parts)
+    columns = ["Submission Date", "Interview Date"]
+    for component_part in component_parts:
+        question = component_part.content_object
+        if question:
+            part_name = question.short_name or question.question
+        else:
+            part_name = component_part.sequence_number
+        columns.append("%s: %s" % (component_part.component, part_name))
+    yield columns
+
+    applications = job.application_set.filter(is_submitted=True)
+    for chunk in iter_chunks(applications, chunk_size):
+        responses = {}
+        application_component_parts = ApplicationComponentPart.objects.filter(
+            application__in=chunk
+        ).values_list("application", "component_part", "content_type", "object_id")
+        for application_id, component_part_id, content_type_id, object_id in application_component_parts:
+            responses[(application_id, component_part_id)] = (content_type_id, object_id)
+        content_objects = load_content_objects(responses.values())
+        prefetch_responses((content_type_id, content_object)
+                           for (content_type_id, object_id), content_object in content_objects.items())
+
+        interviews = {}
+        for interview in Interview.objects.filter(application__in=chunk).order_by("id"):
+            interviews.setdefault(interview.application_id, interview)
+
+        submission_dates = []
+        interview_dates = []
+        for application in chunk:
+            if application.end_datetime:
+                submission_dates.append(application.end_datetime.strftime("%m,%d,%y %I:%M"))
+            else:
+                submission_dates.append("")
+            interview = interviews.get(application.id)
+            if interview:
+                interview_dates.append(interview.datetime.strftime("%m,%d,%y %I:%M"))
+            else:
+                interview_dates.append("")
+        columns = [submission_dates, interview_dates]
+
+        for component_part in component_parts:
+            column = []
+            for application in chunk:
+                key = responses.get((application.id, component_part.id))
+                if key is None:
+                    # The applicant never opened this part.
+                    column.append("")
+                elif key[0] is None:
+                    column.append("empty")
+                elif key not in content_objects:
+                    column.append("")
+                else:
+                    column.append(get_response_type(key[0]).format(content_objects[key]))
+            columns.append(column)
+
+        for row in zip(*columns):
+            yield list(row)
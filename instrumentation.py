@@ -0,0 +1,161 @@
+"""
+Per-request query and timing instrumentation for the jobs views.
+
+While a request is being instrumented (see middleware.InstrumentationMiddleware
+and the JOBS_INSTRUMENTATION setting), every Django query is counted, timed
+and fingerprinted, and code wrapped in ``timed`` adds its time to a category
+such as "sqlalchemy" or "smtp". Outside an instrumented request ``timed`` does
+nothing but call the function.
+
+Each finished request is added to running totals per view kept in Django's
+cache, which the instrumentation page shows. The totals are approximate:
+requests finishing at the same moment in different processes can overwrite
+each other's updates.
+"""
+import re
+import threading
+import time
+
+from django.core.cache import cache
+
+STATS_KEY = "jobs_instrumentation_stats"
+STATS_TIMEOUT = 60 * 60 * 24
+
+_local = threading.local()
+
+_placeholder_lists = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+
+
+def fingerprint(sql):
+    """
+    Returns the SQL with lists of placeholders collapsed, so queries that only
+    differ in the length of an IN list have the same fingerprint.
+    """
+    return _placeholder_lists.sub("(%s, ...)", sql)
+
+
+class Recording(object):
+    """
+    What one request did: its queries by fingerprint, and the seconds spent
+    in each timed category.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.queries = 0
+        self.fingerprints = {}
+        self.seconds = {"orm": 0.0}
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        key = fingerprint(sql)
+        self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+        self.seconds["orm"] += seconds
+
+    def add_time(self, category, seconds):
+        self.seconds[category] = self.seconds.get(category, 0.0) + seconds
+
+    def get_duplicates(self):
+        """
+        Returns a list of ``(count, fingerprint)`` pairs for the queries run
+        more than once, most repeated first.
+        """
+        duplicates = [(count, key) for key, count in self.fingerprints.items() if count > 1]
+        duplicates.sort(reverse=True)
+        return duplicates
+
+
+def start():
+    _local.recording = Recording()
+    return _local.recording
+
+
+def stop():
+    recording = getattr(_local, "recording", None)
+    _local.recording = None
+    return recording
+
+
+def get_recording():
+    return getattr(_local, "recording", None)
+
+
+def timed(category, function, *args, **kwargs):
+    """
+    Calls the function with the given arguments and adds the time it took to
+    the category of the current recording, if there is one.
+    """
+    recording = get_recording()
+    if recording is None:
+        return function(*args, **kwargs)
+    started = time.time()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        recording.add_time(category, time.time() - started)
+
+
+class InstrumentedCursor(object):
+    """
+    Wraps a database cursor to add every query it runs to a recording.
+    """
+    def __init__(self, cursor, recording):
+        self.cursor = cursor
+        self.recording = recording
+
+    def execute(self, sql, params=()):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recording.add_query(sql, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recording.add_query(sql, time.time() - started)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def add_to_stats(view_name, recording, seconds):
+    """
+    Adds a finished request to the running totals for its view.
+    """
+    stats = cache.get(STATS_KEY) or {}
+    view_stats = stats.setdefault(view_name, {"requests": 0,
+                                              "seconds": 0.0,
+                                              "max_seconds": 0.0,
+                                              "queries": 0,
+                                              "duplicate_queries": 0})
+    view_stats["requests"] += 1
+    view_stats["seconds"] += seconds
+    view_stats["max_seconds"] = max(view_stats["max_seconds"], seconds)
+    view_stats["queries"] += recording.queries
+    view_stats["duplicate_queries"] += sum([count - 1 for count, key in recording.get_duplicates()])
+    cache.set(STATS_KEY, stats, STATS_TIMEOUT)
+
+
+def get_stats():
+    """
+    Returns a list of dictionaries of the totals for each view, with their
+    averages, slowest on average first.
+    """
+    stats = []
+    for view_name, view_stats in (cache.get(STATS_KEY) or {}).items():
+        view_stats = dict(view_stats, view=view_name)
+        requests = view_stats["requests"] or 1
+        view_stats["average_seconds"] = view_stats["seconds"] / requests
+        view_stats["average_queries"] = float(view_stats["queries"]) / requests
+        stats.append(view_stats)
+    stats.sort(key=lambda view_stats: view_stats["average_seconds"], reverse=True)
+    return stats
+
+
+def reset_stats():
+    cache.delete(STATS_KEY)
@@ -0,0 +1,12 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.schema import add_missing_admin_statuses
+
+
+class Command(BaseCommand):
+    help = "Gives started applications without an admin status their initial one."
+
+    def handle(self, *args, **options):
+        sys.stdout.write("Added %d admin statuses.\n" % add_missing_admin_statuses())
@@ -0,0 +1,60 @@
+import random
+import sys
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.constraints import AttributeNotEqual, Capacity, numpy
+from wwu_housing.jobs.utils import assign_reviewers
+
+
+class Command(BaseCommand):
+    help = ("Compares reviewer assignment strategies on randomly generated "
+            "reviewers and applicants with a capacity rule and a hall conflict "
+            "rule.")
+    option_list = BaseCommand.option_list + (
+        make_option("--reviewers", type="int", dest="reviewers", default=30),
+        make_option("--applicants", type="int", dest="applicants", default=300),
+        make_option("--halls", type="int", dest="halls", default=8),
+        make_option("--slack", type="float", dest="slack", default=1.0,
+                    help="Total reviewer capacity as a multiple of the number of applicants."),
+        make_option("--runs", type="int", dest="runs", default=5),
+        make_option("--seed", type="int", dest="seed", default=0),
+    )
+
+    def handle(self, *args, **options):
+        capacity = -(-int(options["applicants"] * options["slack"]) // options["reviewers"])
+        rules = [
+            Capacity(capacity),
+            AttributeNotEqual(lambda reviewer: reviewer[1], lambda applicant: applicant[1]),
+        ]
+        get_reviewer_key = lambda reviewer: reviewer[0]
+
+        strategies = ["random", "greedy"]
+        if numpy is not None:
+            strategies.append("vectorized")
+        results = dict((strategy, {"seconds": 0.0, "unassigned": 0})
+                       for strategy in strategies)
+        generator = random.Random(options["seed"])
+        for run in xrange(options["runs"]):
+            reviewers = [("reviewer %d" % index, generator.randrange(options["halls"]))
+                         for index in xrange(options["reviewers"])]
+            applicants = [("applicant %d" % index, generator.randrange(options["halls"]))
+                          for index in xrange(options["applicants"])]
+            for strategy, result in results.items():
+                started = time.time()
+                assignments = assign_reviewers(reviewers, applicants, rules=rules,
+                                               get_reviewer_key=get_reviewer_key,
+                                               strategy=strategy)
+                result["seconds"] += time.time() - started
+                result["unassigned"] += len(assignments.get("_UNASSIGNED", []))
+
+        sys.stdout.write("%d reviewers with capacity %d, %d applicants, %d halls, %d runs\n" % (
+            options["reviewers"], capacity, options["applicants"], options["halls"], options["runs"]))
+        for strategy in strategies:
+            result = results[strategy]
+            sys.stdout.write("%-10s %8.4f seconds/run %8.1f unassigned/run\n" % (
+                strategy, result["seconds"] / options["runs"],
+                float(result["unassigned"]) / options["runs"]))
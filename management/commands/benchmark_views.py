@@ -0,0 +1,58 @@
+import sys
+
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from wwu_housing.jobs.benchmarks import run_benchmarks
+from wwu_housing.jobs.models import Job
+
+
+def _parse_ints(value):
+    return [int(number) for number in value.split(",")]
+
+
+class Command(BaseCommand):
+    help = ("Measures the wall time, queries and peak memory of the jobs "
+            "views for synthetic jobs of several sizes, in a test database.")
+    option_list = BaseCommand.option_list + (
+        make_option("--components", dest="components", default="5",
+                    help="Comma separated numbers of components per job."),
+        make_option("--parts", dest="parts", default="4",
+                    help="Comma separated numbers of parts per component."),
+        make_option("--applicants", dest="applicants", default="10,100,300",
+                    help="Comma separated numbers of applicants per job."),
+    )
+
+    def handle(self, *args, **options):
+        scales = [(components, parts, applicants)
+                  for components in _parse_ints(options["components"])
+                  for parts in _parse_ints(options["parts"])
+                  for applicants in _parse_ints(options["applicants"])]
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            call_command("loaddata", "jobs.json", verbosity=0)
+            User.objects.create_superuser("benchmark-admin", "benchmark@example.com", "benchmark")
+            client = Client()
+            client.login(username="benchmark-admin", password="benchmark")
+            results = run_benchmarks(client, Job.objects.all()[0], scales)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        sys.stdout.write("%-30s %-20s %6s %8s %8s %10s %10s\n" % (
+            "components/parts/applicants", "view", "status", "seconds", "queries",
+            "peak KB", "growth KB"))
+        for scale, name, result in results:
+            sys.stdout.write("%-30s %-20s %6d %8.3f %8d %10d %10d\n" % (
+                "%d/%d/%d" % scale, name, result["status_code"], result["seconds"],
+                result["queries"], result["peak_memory"], result["memory_growth"]))
@@ -0,0 +1,31 @@
+import sys
+import time
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.outbox import drain_outbox, get_outbox_metrics
+
+
+class Command(BaseCommand):
+    help = "Sends queued application status emails."
+    option_list = BaseCommand.option_list + (
+        make_option("--limit", type="int", dest="limit", default=None,
+                    help="The most messages to send per pass."),
+        make_option("--loop", type="int", dest="loop", default=None,
+                    help="Keep draining the outbox, sleeping this many seconds between passes."),
+        make_option("--metrics", action="store_true", dest="metrics", default=False,
+                    help="Print the outbox metrics after each pass."),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            result = drain_outbox(limit=options["limit"])
+            if result["sent"] or result["failed"]:
+                sys.stdout.write("Sent %(sent)d and failed %(failed)d messages in %(seconds).2f seconds (%(rate).1f messages/second).\n" % result)
+            if options["metrics"]:
+                sys.stdout.write("Pending: %(pending)d, failed: %(failed)d, sent in the last hour: %(sent_last_hour)d, oldest pending: %(oldest_pending_seconds)d seconds.\n" % get_outbox_metrics())
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,22 @@
+import sys
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.models import Application, ComponentProgress
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the component progress of applications from their responses."
+    option_list = BaseCommand.option_list + (
+        make_option("--job", dest="job", default=None,
+                    help="Only rebuild the applications for the job with this slug."),
+    )
+
+    def handle(self, *args, **options):
+        applications = Application.objects.all()
+        if options["job"]:
+            applications = applications.filter(job__slug=options["job"])
+        created = ComponentProgress.objects.rebuild(applications)
+        sys.stdout.write("Rebuilt %d component progress rows.\n" % created)
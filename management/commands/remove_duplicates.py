@@ -0,0 +1,25 @@
+import sys
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.schema import remove_duplicates
+
+
+class Command(BaseCommand):
+    help = "Removes duplicate jobs rows that would break the unique indexes."
+    option_list = BaseCommand.option_list + (
+        make_option("--dry-run", action="store_true", dest="dry_run", default=False,
+                    help="Only list the duplicates."),
+    )
+
+    def handle(self, *args, **options):
+        removed = remove_duplicates(dry_run=options["dry_run"])
+        for model, kept_id, duplicate_ids in removed:
+            sys.stdout.write("%s: kept %s, %s %s\n" % (
+                model._meta.verbose_name, kept_id,
+                options["dry_run"] and "would delete" or "deleted",
+                ", ".join([str(id) for id in duplicate_ids])))
+        if not removed:
+            sys.stdout.write("No duplicates found.\n")
@@ -0,0 +1,19 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.models import Job, render_description
+
+
+class Command(BaseCommand):
+    help = ("Renders every job's Markdown description to HTML again, e.g. "
+            "after the Markdown library is upgraded.")
+
+    def handle(self, *args, **options):
+        rendered = 0
+        for id, description in Job.objects.values_list("id", "description").iterator():
+            # Update the rows directly so the jobs' other fields are left alone.
+            Job.objects.filter(id=id).update(description_html=render_description(description))
+            rendered += 1
+        Job.objects.posted_cache.invalidate()
+        sys.stdout.write("Rendered %d job descriptions.\n" % rendered)
@@ -0,0 +1,33 @@
+import sys
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wwu_housing.jobs.schema import (add_missing_admin_statuses, add_missing_progress,
+                                     get_upgrade_sql, upgrade_schema)
+
+
+class Command(BaseCommand):
+    help = ("Adds the jobs app's new columns and indexes to existing tables, "
+            "and the admin statuses and component progress of existing "
+            "applications. Run remove_duplicates first.")
+    option_list = BaseCommand.option_list + (
+        make_option("--sql", action="store_true", dest="sql", default=False,
+                    help="Print the SQL instead of running it."),
+    )
+
+    def handle(self, *args, **options):
+        if options["sql"]:
+            for statement in get_upgrade_sql():
+                sys.stdout.write("%s\n" % statement)
+            return
+
+        for statement, error in upgrade_schema():
+            if error is None:
+                sys.stdout.write("OK: %s\n" % statement)
+            else:
+                sys.stdout.write("Failed: %s (%s)\n" % (statement, error))
+
+        sys.stdout.write("Added %d admin statuses.\n" % add_missing_admin_statuses())
+        sys.stdout.write("Added %d component progress rows.\n" % add_missing_progress())
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+import instrumentation
+
+logger = logging.getLogger("wwu_housing.jobs.instrumentation")
+
+
+class InstrumentationMiddleware(object):
+    """
+    Records the queries and timings of each request when the
+    JOBS_INSTRUMENTATION setting is true, and reports them in a log line and
+    X-Jobs-* response headers. Put it first in MIDDLEWARE_CLASSES so the
+    queries of the other middleware are recorded too.
+
+    Streamed responses (like the CSV exports) run most of their queries after
+    the response leaves the middleware, so those aren't recorded.
+    """
+    def process_request(self, request):
+        if not getattr(settings, "JOBS_INSTRUMENTATION", False):
+            return None
+        recording = instrumentation.start()
+        cursor = connection.cursor
+
+        # The connection is local to the thread, so this only wraps the
+        # cursors of this request.
+        def instrumented_cursor():
+            return instrumentation.InstrumentedCursor(cursor(), recording)
+        connection.cursor = instrumented_cursor
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.jobs_view_name = "%s.%s" % (view_func.__module__, view_func.__name__)
+        return None
+
+    def process_response(self, request, response):
+        recording = instrumentation.stop()
+        if recording is None:
+            return response
+        if "cursor" in connection.__dict__:
+            del connection.cursor
+
+        seconds = time.time() - recording.started
+        view_name = getattr(request, "jobs_view_name", None)
+        duplicates = recording.get_duplicates()
+        duplicate_count = sum([count - 1 for count, key in duplicates])
+
+        response["X-Jobs-Seconds"] = "%.4f" % seconds
+        response["X-Jobs-Queries"] = str(recording.queries)
+        response["X-Jobs-Duplicate-Queries"] = str(duplicate_count)
+        fields = ["view=%s" % view_name,
+                  "path=%s" % request.path,
+                  "status=%s" % response.status_code,
+                  "seconds=%.4f" % seconds,
+                  "queries=%d" % recording.queries,
+                  "duplicate_queries=%d" % duplicate_count]
+        for category, category_seconds in sorted(recording.seconds.items()):
+            response["X-Jobs-%s-Seconds" % category.upper()] = "%.4f" % category_seconds
+            fields.append("%s_seconds=%.4f" % (category, category_seconds))
+        logger.info(" ".join(fields))
+        for count, key in duplicates:
+            logger.info("view=%s duplicate_count=%d sql=%r" % (view_name, count, key))
+
+        if view_name:
+            instrumentation.add_to_stats(view_name, recording, seconds)
+        return response
@@ -1,24 +1,87 @@
+import collections
+import copy
 import datetime
 import tagging
 
+from string import Template
+
 from django.conf import settings
 from django.contrib.auth.models import Permission, User
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.contrib.markup.templatetags.markup import markdown
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Max
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save
 from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode
 
 from tagging.models import Tag
 
+from wwu_housing.jobs import LocalCache, registry
 from wwu_housing.library.models import Address
 
 
+def render_description(description):
+    """
+    Returns a job description rendered from Markdown to HTML.
+    """
+    return force_unicode(markdown(description))
+
+
 class JobManager(models.Manager):
     """
     Custom manager for job instances.
+
+    The posted jobs are kept in a per-process cache which is reloaded when the
+    next job is posted or closes, and after any job is saved or deleted.
     """
-    def posted(self):
-        return self.filter(post_datetime__lte=datetime.datetime.now(), close_datetime__gt=datetime.datetime.now())
+    posted_cache = LocalCache("posted_jobs")
+
+    def posted(self, now=None):
+        now = now or datetime.datetime.now()
+        return self.filter(post_datetime__lte=now, close_datetime__gt=now)
+
+    def _get_posted_cache(self, now):
+        self.posted_cache.validate()
+        if (not self.posted_cache or
+            not self.posted_cache["loaded"] <= now < self.posted_cache["expires"]):
+            jobs = list(self.posted(now))
+            # The posted jobs only change when a posted job closes or another
+            # job is posted.
+            boundaries = [job.close_datetime for job in jobs]
+            boundaries.extend(self.filter(post_datetime__gt=now).order_by(
+                "post_datetime"
+            ).values_list("post_datetime", flat=True)[:1])
+            self.posted_cache.clear()
+            self.posted_cache.update({
+                "jobs": jobs,
+                "slugs": dict((job.slug, job) for job in jobs),
+                "loaded": now,
+                "expires": boundaries and min(boundaries) or datetime.datetime.max,
+            })
+        return self.posted_cache
+
+    def posted_jobs(self, now=None):
+        """
+        Returns a list of the jobs posted at ``now`` (by default, the current
+        time) from the posted jobs cache.
+        """
+        now = now or datetime.datetime.now()
+        return [copy.copy(job) for job in self._get_posted_cache(now)["jobs"]]
+
+    def get_posted(self, slug, now=None):
+        """
+        Returns the posted job with the given slug from the posted jobs cache.
+        Raises DoesNotExist if there isn't one.
+        """
+        now = now or datetime.datetime.now()
+        try:
+            return copy.copy(self._get_posted_cache(now)["slugs"][slug])
+        except KeyError:
+            raise self.model.DoesNotExist("No posted job with slug '%s'." % slug)
 
 
 class Job(models.Model):
@@ -34,6 +97,8 @@ class Job(models.Model):
 
     # TODO: add help text re: the purpose of this field
     description = models.TextField(help_text="Use Markdown to format text")
+    description_html = models.TextField(blank=True, editable=False,
+                                        help_text="The description rendered from Markdown.")
 
     # TODO: make all datetime fields optional initially. Not having a time set
     # will just exclude the posting from dynamically generated pages.
@@ -51,6 +116,7 @@ class Job(models.Model):
         # after that, the user probably knows what they are doing
         if not self.slug and not self.id:
             self.slug = slugify(self.title)
+        self.description_html = render_description(self.description)
         super(Job, self).save(*args, **kwargs)
 
     def add_tag(self, tag):
@@ -66,21 +132,21 @@ class Job(models.Model):
     def __unicode__(self):
         return "%s (post: %s)" % (self.title, self.post_datetime)
 
-    def is_posted(self):
+    def is_posted(self, now=None):
         """Returns whether the job posting is ready to be posted on jobs pages."""
-        return self.post_datetime <= datetime.datetime.now() < self.close_datetime
+        return self.post_datetime <= (now or datetime.datetime.now()) < self.close_datetime
 
-    def is_active(self):
+    def is_active(self, now=None):
         """Returns whether the job posting is currently active."""
-        return self.open_datetime <= datetime.datetime.now() < self.close_datetime
+        return self.open_datetime <= (now or datetime.datetime.now()) < self.close_datetime
 
-    def is_open(self):
+    def is_open(self, now=None):
         """Returns whether the application deadline has passed or not."""
-        return self.open_datetime <= datetime.datetime.now() < self.deadline
+        return self.open_datetime <= (now or datetime.datetime.now()) < self.deadline
 
-    def will_open(self):
+    def will_open(self, now=None):
         """Returns whether the application will open in the future."""
-        return self.open_datetime > datetime.datetime.now()
+        return self.open_datetime > (now or datetime.datetime.now())
 
     @models.permalink
     def get_absolute_url(self):
@@ -103,6 +169,12 @@ except tagging.AlreadyRegistered:
     pass
 
 
+def invalidate_posted_jobs(sender, **kwargs):
+    Job.objects.posted_cache.invalidate()
+post_save.connect(invalidate_posted_jobs, sender=Job)
+post_delete.connect(invalidate_posted_jobs, sender=Job)
+
+
 class JobUser(models.Model):
     """
     Describes the adminstrative roles for any given job.
@@ -116,6 +188,7 @@ class JobUser(models.Model):
     job  = models.ForeignKey(Job)
 
     class Meta:
+        unique_together = (("user", "job"),)
         permissions = (
             ("can_view", "Can view only"),
             ("can_do", "Can do all"),
@@ -192,6 +265,14 @@ class ComponentPart(models.Model):
         ordering = ("sequence_number",)
 
 
+def invalidate_form_plans(sender, **kwargs):
+    registry.plans.invalidate()
+post_save.connect(invalidate_form_plans, sender=Component)
+post_delete.connect(invalidate_form_plans, sender=Component)
+post_save.connect(invalidate_form_plans, sender=ComponentPart)
+post_delete.connect(invalidate_form_plans, sender=ComponentPart)
+
+
 class Applicant(models.Model):
     """A user with contact information and data specific to being an applicant to a job."""
     user = models.ForeignKey(User, unique=True)
@@ -207,6 +288,39 @@ class Applicant(models.Model):
         return Application.objects.get(applicant=self, job=job)
 
 
+class ApplicationQuerySet(QuerySet):
+    """
+    Custom queryset for applications.
+    """
+    def with_status(self):
+        """
+        Annotates each application with the id of its admin status, if it has
+        one, so its status property can be read from the status registry
+        without another query.
+        """
+        qn = connection.ops.quote_name
+        admin_table = qn(AdminApplication._meta.db_table)
+        sql = "SELECT %s.%s FROM %s WHERE %s.%s = %s.%s ORDER BY %s.%s DESC LIMIT 1" % (
+            admin_table, qn(AdminApplication._meta.get_field("status").column),
+            admin_table,
+            admin_table, qn(AdminApplication._meta.get_field("application").column),
+            qn(Application._meta.db_table), qn(Application._meta.pk.column),
+            admin_table, qn(AdminApplication._meta.pk.column),
+        )
+        return self.extra(select={"admin_status_id": sql})
+
+
+class ApplicationManager(models.Manager):
+    """
+    Custom manager for application instances.
+    """
+    def get_query_set(self):
+        return ApplicationQuerySet(self.model, using=self._db)
+
+    def with_status(self):
+        return self.get_query_set().with_status()
+
+
 class Application(models.Model):
     """
     A relationship between an applicant and a job that represents the
@@ -221,18 +335,31 @@ class Application(models.Model):
     component_parts = models.ManyToManyField(ComponentPart, through="ApplicationComponentPart")
     is_submitted = models.BooleanField(blank=True)
 
+    objects = ApplicationManager()
+
+    class Meta:
+        unique_together = (("applicant", "job"),)
+
     def __unicode__(self):
         return u"%s for %s" % (self.applicant, self.job)
 
     def _get_status(self):
-        try:
-            application_status = AdminApplication.objects.get(application=self)
-            status = application_status.status
-        except AdminApplication.DoesNotExist:
-            if self.end_datetime or self.is_submitted:
-                status = ApplicationStatus.objects.get(status=u"Submitted")
-            else:
-                status = ApplicationStatus.objects.get(status=u"In Progress")
+        # Applications loaded with Application.objects.with_status() already
+        # know their admin status.
+        if hasattr(self, "admin_status_id"):
+            status_id = self.admin_status_id
+        else:
+            status_ids = AdminApplication.objects.filter(
+                application=self
+            ).order_by("-id").values_list("status", flat=True)[:1]
+            status_id = status_ids and status_ids[0] or None
+
+        if status_id is not None:
+            status = ApplicationStatus.objects.get_cached(status_id)
+        elif self.end_datetime or self.is_submitted:
+            status = ApplicationStatus.objects.get_by_status(u"Submitted")
+        else:
+            status = ApplicationStatus.objects.get_by_status(u"In Progress")
         return status
     status = property(_get_status)
 
@@ -263,9 +390,183 @@ class ApplicationComponentPart(models.Model):
     object_id = models.PositiveIntegerField(blank=True, null=True)
     content_object = generic.GenericForeignKey("content_type", "object_id")
 
+    class Meta:
+        unique_together = (("application", "component_part"),)
+
     def save(self, *args, **kwargs):
+        # Callers saving many parts at once pass refresh_progress=False and
+        # refresh the progress of each component once themselves.
+        refresh_progress = kwargs.pop("refresh_progress", True)
         self.activity_date = datetime.datetime.now()
         super(ApplicationComponentPart, self).save(*args, **kwargs)
+        if refresh_progress:
+            ComponentProgress.objects.refresh(self.application_id, self.get_component_id())
+
+    def get_component_id(self):
+        """
+        Returns the id of the component part's component, using the component
+        part if it's already loaded. Returns None if the component part no
+        longer exists.
+        """
+        component_part = getattr(self, self._meta.get_field("component_part").get_cache_name(), None)
+        if component_part is not None:
+            return component_part.component_id
+        component_ids = ComponentPart.objects.filter(
+            id=self.component_part_id
+        ).values_list("component", flat=True)
+        return component_ids and component_ids[0] or None
+
+
+class ComponentProgressManager(models.Manager):
+    """
+    Custom manager which keeps component progress in step with application
+    component parts.
+    """
+    def _get_responses(self):
+        return ApplicationComponentPart.objects.filter(content_type__isnull=False,
+                                                       object_id__isnull=False)
+
+    def _set(self, application_id, component_id, create=True, **values):
+        rows = self.filter(application=application_id, component=component_id)
+        if rows.update(**values) or not create:
+            return
+        # Another save may create the row between the update and the insert,
+        # in which case the insert breaks the unique constraint; update the
+        # row it created instead.
+        savepoint = transaction.savepoint()
+        try:
+            self.create(application_id=application_id, component_id=component_id, **values)
+        except IntegrityError:
+            transaction.savepoint_rollback(savepoint)
+            rows.update(**values)
+        else:
+            transaction.savepoint_commit(savepoint)
+
+    def refresh(self, application_id, component_id, create=True):
+        """
+        Recomputes the progress of one application's component from its
+        responses. If the application has no progress row for the component,
+        one is created unless ``create`` is False.
+        """
+        totals = self._get_responses().filter(
+            application=application_id,
+            component_part__component=component_id
+        ).aggregate(completed_count=Count("component_part", distinct=True),
+                    activity_date=Max("activity_date"))
+        self._set(application_id, component_id, create,
+                  completed_count=totals["completed_count"],
+                  part_count=ComponentPart.objects.filter(component=component_id).count(),
+                  activity_date=totals["activity_date"])
+
+    def refresh_component(self, component_id):
+        """
+        Recomputes the progress of every application's component, e.g. after
+        the component's parts change.
+        """
+        part_count = ComponentPart.objects.filter(component=component_id).count()
+        self.filter(component=component_id).update(completed_count=0,
+                                                   part_count=part_count,
+                                                   activity_date=None)
+        totals = self._get_responses().filter(
+            component_part__component=component_id
+        ).values("application").annotate(completed_count=Count("component_part", distinct=True),
+                                         activity_date=Max("activity_date"))
+        for total in totals:
+            self._set(total["application"], component_id, False,
+                      completed_count=total["completed_count"],
+                      part_count=part_count,
+                      activity_date=total["activity_date"])
+
+    def add_missing(self, chunk_size=500):
+        """
+        Rebuilds the progress of the applications that have responses to a
+        component but no progress row for it, such as every application
+        started before progress was kept, and returns the number of rows
+        created.
+        """
+        responded = set(self._get_responses().values_list(
+            "application", "component_part__component"
+        ).distinct())
+        kept = set(self.values_list("application", "component"))
+        application_ids = sorted(set(application_id for application_id, component_id in responded - kept))
+        created = 0
+        for index in xrange(0, len(application_ids), chunk_size):
+            created += self.rebuild(application_ids[index:index + chunk_size])
+        return created
+
+    def rebuild(self, applications):
+        """
+        Deletes and recomputes the progress of the given applications, which
+        may be a queryset. Returns the number of progress rows created.
+        """
+        self.filter(application__in=applications).delete()
+        part_counts = dict(
+            (part_count["component"], part_count["part_count"])
+            for part_count in ComponentPart.objects.values("component").annotate(
+                part_count=Count("id")
+            )
+        )
+        totals = self._get_responses().filter(
+            application__in=applications
+        ).values("application", "component_part__component").annotate(
+            completed_count=Count("component_part", distinct=True),
+            activity_date=Max("activity_date")
+        )
+        created = 0
+        for total in totals:
+            component_id = total["component_part__component"]
+            self.create(application_id=total["application"],
+                        component_id=component_id,
+                        completed_count=total["completed_count"],
+                        part_count=part_counts.get(component_id, 0),
+                        activity_date=total["activity_date"])
+            created += 1
+        return created
+
+
+class ComponentProgress(models.Model):
+    """
+    How many of a component's parts an application has responded to, and
+    when it last responded. Rows are kept up to date as application component
+    parts and component parts are saved and deleted. upgrade_jobs_schema
+    creates them for applications started before they were kept, and they can
+    be rebuilt with the rebuild_progress management command.
+    """
+    application = models.ForeignKey(Application)
+    component = models.ForeignKey(Component)
+    completed_count = models.PositiveIntegerField(default=0)
+    part_count = models.PositiveIntegerField(default=0)
+    activity_date = models.DateTimeField(blank=True, null=True)
+
+    objects = ComponentProgressManager()
+
+    class Meta:
+        unique_together = (("application", "component"),)
+        verbose_name_plural = "component progress"
+
+    def __unicode__(self):
+        return u"%s: %s of %s" % (self.component, self.completed_count, self.part_count)
+
+    def is_complete(self):
+        """Returns whether every part of the component has a response."""
+        return self.completed_count >= self.part_count
+
+
+def update_application_progress(sender, instance, **kwargs):
+    component_id = instance.get_component_id()
+    if component_id is None:
+        # The component part is being deleted too, which refreshes the
+        # component's progress.
+        return
+    # Don't create rows here, since the application may be being deleted.
+    ComponentProgress.objects.refresh(instance.application_id, component_id, create=False)
+post_delete.connect(update_application_progress, sender=ApplicationComponentPart)
+
+
+def update_component_progress(sender, instance, **kwargs):
+    ComponentProgress.objects.refresh_component(instance.component_id)
+post_save.connect(update_component_progress, sender=ComponentPart)
+post_delete.connect(update_component_progress, sender=ComponentPart)
 
 
 class Date(models.Model):
@@ -296,24 +597,132 @@ class Qualification(models.Model):
                                      false when given an Applicant object.""")
 
 
+class ApplicationStatusManager(models.Manager):
+    """
+    Custom manager for application statuses which keeps every status in a
+    per-process registry. The registry is loaded with one query and reloaded
+    after any status is saved or deleted. Statuses are returned as copies, so
+    callers can't change the registry's instances.
+    """
+    registry = LocalCache("application_statuses")
+
+    def _get_registry(self):
+        self.registry.validate()
+        if not self.registry:
+            statuses = list(self.all())
+            self.registry["id"] = dict((status.id, status) for status in statuses)
+            self.registry["status"] = dict((status.status, status) for status in statuses)
+        return self.registry
+
+    def get_cached(self, id):
+        """Returns the status with the given id from the registry."""
+        try:
+            return copy.copy(self._get_registry()["id"][id])
+        except KeyError:
+            raise self.model.DoesNotExist("No application status with id %s." % id)
+
+    def get_by_status(self, status):
+        """Returns the status with the given name from the registry."""
+        try:
+            return copy.copy(self._get_registry()["status"][status])
+        except KeyError:
+            raise self.model.DoesNotExist("No application status named '%s'." % status)
+
+    def get_all(self):
+        """Returns every status from the registry, ordered by weight."""
+        statuses = [copy.copy(status) for status in self._get_registry()["id"].values()]
+        statuses.sort(key=lambda status: (status.weight, status.id))
+        return statuses
+
+
 class ApplicationStatus(models.Model):
     """
     Statuses for applications.
     """
-    status = models.CharField(max_length=255)
+    status = models.CharField(max_length=255, unique=True)
     weight = models.PositiveIntegerField(blank=True, null=True)
 
+    objects = ApplicationStatusManager()
+
     def __unicode__(self):
         return self.status
 
 
+def invalidate_application_statuses(sender, **kwargs):
+    ApplicationStatus.objects.registry.invalidate()
+post_save.connect(invalidate_application_statuses, sender=ApplicationStatus)
+post_delete.connect(invalidate_application_statuses, sender=ApplicationStatus)
+
+
 ###TODO### Rename this AdminStatus
+class AdminApplicationManager(models.Manager):
+    """
+    Custom manager for admin statuses.
+    """
+    def get_initial_status(self, application):
+        """
+        Returns the status an application starts with: Submitted if it has
+        been submitted, otherwise In Progress.
+        """
+        if application.is_submitted or application.end_datetime:
+            return ApplicationStatus.objects.get_by_status(u"Submitted")
+        return ApplicationStatus.objects.get_by_status(u"In Progress")
+
+    def create_missing(self, applications):
+        """
+        Gives each of the applications (which may be a queryset) that has no
+        admin status its initial one. Returns the number created.
+        """
+        created = 0
+        for application in applications.filter(adminapplication__isnull=True):
+            self.create(application=application, status=self.get_initial_status(application))
+            created += 1
+        return created
+
+
 class AdminApplication(models.Model):
     """
     Admin backend for storing application and its status.
     """
     status = models.ForeignKey(ApplicationStatus)
-    application = models.ForeignKey(Application)
+    application = models.OneToOneField(Application)
+
+    objects = AdminApplicationManager()
+
+
+# The placeholders an application email's content may use, e.g. $name.
+EMAIL_PLACEHOLDERS = ("name",)
+
+
+# The parts of an application email needed to send it: its name, subject,
+# sender and content parsed into a string.Template.
+EmailTemplate = collections.namedtuple("EmailTemplate", "name subject sender template")
+
+
+class ApplicationEmailManager(models.Manager):
+    """
+    Custom manager for application emails which keeps them as EmailTemplates
+    in a per-process cache indexed by job and status. The cache is emptied
+    after any email is saved or deleted.
+    """
+    templates = LocalCache("application_emails")
+
+    def get_template(self, job_id, status_id):
+        """
+        Returns the EmailTemplate for the job and status, or None if there is
+        no email for them.
+        """
+        self.templates.validate()
+        key = (job_id, status_id)
+        if key not in self.templates:
+            emails = self.filter(job=job_id, status=status_id).order_by("-id").values_list(
+                "name", "subject", "sender", "content"
+            )[:1]
+            template = None
+            for name, subject, sender, content in emails:
+                template = EmailTemplate(name, subject, sender, Template(content))
+            self.templates[key] = template
+        return self.templates[key]
 
 
 class ApplicationEmail(models.Model):
@@ -321,8 +730,68 @@ class ApplicationEmail(models.Model):
     Emails to be sent to potential employees.
     """
     name = models.CharField(max_length=255)
-    content = models.TextField()
+    content = models.TextField(help_text="May use these placeholders: %s." % ", ".join(
+        ["$%s" % placeholder for placeholder in EMAIL_PLACEHOLDERS]
+    ))
     job = models.ForeignKey(Job)
     sender = models.CharField(max_length=255)
     status = models.ForeignKey(ApplicationStatus)
     subject = models.CharField(max_length=255)
+
+    objects = ApplicationEmailManager()
+
+    def clean(self):
+        # Catch unknown placeholders now rather than when the email is sent.
+        values = dict((placeholder, "") for placeholder in EMAIL_PLACEHOLDERS)
+        try:
+            Template(self.content).substitute(values)
+        except KeyError, e:
+            raise ValidationError("Unknown placeholder $%s in the content." % e.args[0])
+        except ValueError, e:
+            raise ValidationError("Invalid placeholder in the content: %s." % e)
+
+
+def invalidate_application_email_templates(sender, **kwargs):
+    ApplicationEmail.objects.templates.invalidate()
+post_save.connect(invalidate_application_email_templates, sender=ApplicationEmail)
+post_delete.connect(invalidate_application_email_templates, sender=ApplicationEmail)
+
+
+class OutboxMessage(models.Model):
+    """
+    An application status email waiting to be sent by the outbox worker (see
+    the drain_outbox management command).
+    """
+    application = models.ForeignKey(Application)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField(blank=True, help_text="Comma separated email addresses.")
+    notify_admins = models.BooleanField(default=False,
+                                        help_text="Whether to send a copy to the site admins.")
+    comment = models.TextField(blank=True,
+                               help_text="Comment to post on the application once the email is sent.")
+    user = models.ForeignKey(User, blank=True, null=True,
+                             help_text="The user who changed the application's status.")
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    sent_datetime = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_datetime = models.DateTimeField(blank=True, null=True,
+                                            help_text="When a sender last claimed the message to send it.")
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("id",)
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.subject, self.to)
+
+    def get_recipients(self):
+        return [address.strip() for address in self.to.split(",") if address.strip()]
+
+
+# The summaries module connects the receivers that keep cached per-user
+# summaries fresh. It's imported here, once the models it uses are defined,
+# so they're connected in every process that uses the models (management
+# commands and shells too), not only in the ones that import the views.
+import summaries
@@ -0,0 +1,328 @@
+"""
+Application status changes and the outbox of status emails they queue.
+
+Status changes are saved in one transaction along with an OutboxMessage for
+each email they trigger. The emails are sent later, outside the request, by
+``drain_outbox`` (see the drain_outbox management command), or at the end of
+the request when the JOBS_SEND_EMAILS_ON_REQUEST setting is on. Either way
+every message in a batch goes over one mail connection.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+
+import instrumentation
+from models import AdminApplication, Application, ApplicationEmail, ApplicationStatus, OutboxMessage
+from summaries import invalidate_user_summaries
+from utils import _get_persons_for_applications
+
+# Messages that have failed this many times are left for an admin to look at.
+MAX_ATTEMPTS = 5
+
+# How many times to retry sending a message in one pass, and the seconds to
+# wait before the first retry (doubled before each one after).
+SEND_RETRIES = 2
+RETRY_DELAY = 1.0
+
+# How long a sender's claim on a message lasts. A message claimed longer ago
+# than this (e.g. by a worker that died) can be claimed again.
+CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+
+# Statuses whose emails are sent by hand.
+UNQUEUED_STATUSES = [u"Position Offered", u"Position Accepted"]
+
+
+def queue_status_email(job, application, person, status, user=None):
+    """
+    Queues the job's email for the application's new status, if it has one,
+    and returns the queued OutboxMessage or None.
+    """
+    if status.status in UNQUEUED_STATUSES or settings.DEBUG:
+        return None
+    application_email = ApplicationEmail.objects.get_template(job.id, status.id)
+    if application_email is None:
+        return None
+
+    if person.email:
+        try:
+            message = application_email.template.substitute(name=person.first_name)
+        except KeyError, e:
+            # Emails saved before their placeholders were validated may still
+            # use unknown ones.
+            return OutboxMessage.objects.create(
+                application=application,
+                subject="KeyError in application email",
+                body="%s in application email id: %s" % (e.message, application_email.name),
+                from_email=settings.SERVER_EMAIL,
+                notify_admins=True,
+                user=user
+            )
+        return OutboxMessage.objects.create(
+            application=application,
+            subject=application_email.subject,
+            body=message,
+            from_email=application_email.sender,
+            to=person.email,
+            comment="%s email has been sent" % status,
+            user=user
+        )
+
+    subject = "%s %s for position %s has no email" % (person.first_name, person.last_name, job)
+    message = "%s %s (%s) does not have an email address. They applied for %s and were supposed to receive %s email." % (person.first_name, person.last_name, person.student_id, job, application_email.subject)
+    return OutboxMessage.objects.create(
+        application=application,
+        subject=subject,
+        body=message,
+        from_email=application_email.sender,
+        to=application_email.sender,
+        notify_admins=True,
+        comment="%s no email could be sent" % status,
+        user=user
+    )
+
+
+@transaction.commit_on_success
+def apply_status_changes(job, changes, user=None):
+    """
+    Saves valid AdminApplicationForms whose status changed and queues status
+    emails for them, all in one transaction.
+
+    ``changes`` is an iterable of ``(form, person)`` pairs where ``person`` is
+    the applicant's person object.
+    """
+    queued = []
+    for form, person in changes:
+        status = form.cleaned_data["status"]
+        if form.instance.id and form.initial["status"] == status.id:
+            continue
+        form.save()
+        if form.initial["status"] != status.id:
+            message = queue_status_email(job, form.instance.application, person, status, user)
+            if message:
+                queued.append(message)
+    return queued
+
+
+@transaction.commit_on_success
+def apply_status_deltas(job, statuses, user=None):
+    """
+    Sets the admin status of the job's applications from ``statuses``, a
+    dictionary of status ids indexed by application id, and queues status
+    emails for the ones that changed, all in one transaction.
+
+    The statuses are set with one UPDATE per new status, so applications
+    whose status didn't change cost nothing beyond the query that finds them.
+    Unknown applications are ignored and unknown statuses raise
+    ApplicationStatus.DoesNotExist. Returns a list of ``(application,
+    status, message)`` tuples for the applications that changed, where
+    ``message`` is the queued OutboxMessage or None.
+    """
+    for status_id in set(statuses.values()):
+        ApplicationStatus.objects.get_cached(status_id)
+    changed = {}
+    for application_id, status_id in AdminApplication.objects.filter(
+        application__job=job, application__in=statuses.keys()
+    ).values_list("application", "status"):
+        if statuses[application_id] != status_id:
+            changed.setdefault(statuses[application_id], []).append(application_id)
+    if not changed:
+        return []
+
+    for status_id, application_ids in changed.items():
+        AdminApplication.objects.filter(application__in=application_ids).update(status=status_id)
+    applications = list(Application.objects.filter(
+        id__in=[id for ids in changed.values() for id in ids]
+    ).select_related("applicant__user"))
+    invalidate_user_summaries([application.applicant.user_id for application in applications])
+
+    updated = []
+    persons = _get_persons_for_applications(applications)
+    for application in applications:
+        status = ApplicationStatus.objects.get_cached(statuses[application.id])
+        person = persons[application.applicant.user.username]
+        message = queue_status_email(job, application, person, status, user)
+        updated.append((application, status, message))
+    return updated
+
+
+def _get_emails(message):
+    """
+    Returns the emails an outbox message is sent as: a copy for the site
+    admins if it notifies them, and the message to its recipients.
+    """
+    emails = []
+    if message.notify_admins and settings.ADMINS:
+        emails.append(EmailMessage(settings.EMAIL_SUBJECT_PREFIX + message.subject,
+                                   message.body, settings.SERVER_EMAIL,
+                                   [email for name, email in settings.ADMINS]))
+    recipients = message.get_recipients()
+    if recipients:
+        emails.append(EmailMessage(message.subject, message.body, message.from_email, recipients))
+    return emails
+
+
+def _get_claimable(now):
+    return Q(claimed_datetime__isnull=True) | Q(claimed_datetime__lt=now - CLAIM_TIMEOUT)
+
+
+def _claim(message):
+    """
+    Claims the message for this sender and counts the attempt, with one
+    UPDATE that only matches if no other sender has claimed or sent the
+    message since it was loaded. Returns whether the claim succeeded.
+    """
+    now = datetime.datetime.now()
+    claimed = OutboxMessage.objects.filter(
+        _get_claimable(now),
+        id=message.id,
+        sent_datetime__isnull=True,
+        attempts=message.attempts
+    ).update(attempts=message.attempts + 1, claimed_datetime=now)
+    if claimed:
+        message.attempts += 1
+        message.claimed_datetime = now
+    return bool(claimed)
+
+
+def _send(connection, emails, retries, delay):
+    """
+    Sends the emails over the connection one at a time, removing each from
+    the list once it's sent. If a send fails, the connection is reopened and
+    the emails left tried again up to ``retries`` times, waiting ``delay``
+    seconds before the first retry and twice as long before each one after.
+    Raises the last error if every try fails.
+    """
+    for attempt in xrange(retries + 1):
+        if attempt:
+            connection.close()
+            time.sleep(delay * 2 ** (attempt - 1))
+        try:
+            connection.open()
+            while emails:
+                connection.send_messages(emails[:1])
+                del emails[0]
+            return
+        except Exception, e:
+            error = e
+    raise error
+
+
+def send_outbox_messages(messages, connection=None, retries=SEND_RETRIES, delay=RETRY_DELAY,
+                         max_failures=None):
+    """
+    Sends the outbox messages over one mail connection (by default, one from
+    the EMAIL_BACKEND setting), posts the comments of the ones sent, and saves
+    each one's outcome: its number of attempts and either when it was sent or
+    its error. Each message is claimed before it's sent and skipped if another
+    sender got to it first, so concurrent senders never send it twice. With
+    ``max_failures``, sending stops once that many messages have failed,
+    leaving the rest untouched.
+
+    Returns a dictionary of how many messages were sent and failed, how long
+    it took, the number of messages sent per second, and a list of ``(message
+    id, error)`` pairs where ``error`` is None for messages that were sent.
+    """
+    content_type = ContentType.objects.get_for_model(Application)
+    site = Site.objects.get_current()
+    sent = failed = 0
+    outcomes = []
+    started = time.time()
+    connection = connection or get_connection()
+    try:
+        for message in messages:
+            if max_failures is not None and failed >= max_failures:
+                break
+            if not _claim(message):
+                # Another sender has it.
+                continue
+            emails = _get_emails(message)
+            count = len(emails)
+            try:
+                instrumentation.timed("smtp", _send, connection, emails, retries, delay)
+            except Exception, e:
+                message.error = unicode(e)
+                failed += 1
+                # The admins' copy goes first, so if anything was sent it was;
+                # don't send it again with the next try.
+                if message.notify_admins and len(emails) < count:
+                    message.notify_admins = False
+            else:
+                message.sent_datetime = datetime.datetime.now()
+                message.error = ""
+                sent += 1
+                if message.comment:
+                    Comment.objects.create(content_type=content_type,
+                                           object_pk=message.application_id,
+                                           site=site,
+                                           user=message.user,
+                                           comment=message.comment)
+            message.claimed_datetime = None
+            message.save()
+            outcomes.append((message.id, message.error or None))
+    finally:
+        connection.close()
+
+    seconds = time.time() - started
+    return {"sent": sent,
+            "failed": failed,
+            "seconds": seconds,
+            "rate": seconds and sent / seconds or 0.0,
+            "outcomes": outcomes}
+
+
+def drain_outbox(limit=None, connection=None):
+    """
+    Sends unsent outbox messages in the order they were queued with
+    ``send_outbox_messages`` and returns its results.
+    """
+    messages = OutboxMessage.objects.filter(_get_claimable(datetime.datetime.now()),
+                                            sent_datetime__isnull=True,
+                                            attempts__lt=MAX_ATTEMPTS)
+    if limit:
+        messages = messages[:limit]
+    return send_outbox_messages(messages, connection)
+
+
+def send_queued(messages):
+    """
+    Sends messages queued during a request right away when the
+    JOBS_SEND_EMAILS_ON_REQUEST setting is on. Otherwise they're left for
+    ``drain_outbox``.
+    """
+    messages = [message for message in messages if message]
+    if messages and getattr(settings, "JOBS_SEND_EMAILS_ON_REQUEST", False):
+        # Don't keep the request waiting on retries or on a mail server that's
+        # down; whatever isn't sent is left for drain_outbox.
+        return send_outbox_messages(messages, retries=0, max_failures=1)
+    return None
+
+
+def get_outbox_metrics():
+    """
+    Returns a dictionary describing the state of the outbox: the number of
+    messages waiting to be sent, given up on, and sent in the last hour, and
+    how long in seconds the oldest waiting message has been queued.
+    """
+    now = datetime.datetime.now()
+    unsent = OutboxMessage.objects.filter(sent_datetime__isnull=True)
+    pending = unsent.filter(attempts__lt=MAX_ATTEMPTS)
+    oldest = pending.order_by("created_datetime").values_list("created_datetime", flat=True)[:1]
+    if oldest:
+        delta = now - oldest[0]
+        oldest_age = delta.days * 86400 + delta.seconds
+    else:
+        oldest_age = 0
+    sent_last_hour = OutboxMessage.objects.filter(
+        sent_datetime__gte=now - datetime.timedelta(hours=1)
+    ).count()
+    return {"pending": pending.count(),
+            "failed": unsent.filter(attempts__gte=MAX_ATTEMPTS).count(),
+            "sent_last_hour": sent_last_hour,
+            "oldest_pending_seconds": oldest_age}
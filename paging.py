@@ -0,0 +1,49 @@
+"""
+Keyset pagination.
+
+Pages are found by the sort value and id of the last row on the previous page
+rather than by an offset, so a page deep into a long list costs no more to
+load than the first one.
+"""
+from django.db.models import Q
+
+
+def encode_cursor(value, id):
+    return u"%s:%s" % (value, id)
+
+
+def decode_cursor(cursor, to_python=int):
+    """
+    Returns the ``(value, id)`` pair from a cursor made by ``encode_cursor``,
+    converting the value with ``to_python``. Raises ValueError for a cursor
+    that can't be decoded.
+    """
+    value, id = cursor.rsplit(u":", 1)
+    return to_python(value), int(id)
+
+
+def get_page(queryset, field, cursor=None, page_size=50, descending=False,
+             to_python=int):
+    """
+    Returns a list of the ids of the rows after ``cursor`` in the queryset
+    ordered by ``field`` (which may span relations) and then id, and the
+    cursor for the following page, or None if this is the last page.
+
+    ``field`` mustn't be nullable, since NULLs sort differently on different
+    databases.
+    """
+    direction = descending and "-" or ""
+    queryset = queryset.order_by(direction + field, direction + "id")
+    if cursor:
+        value, id = decode_cursor(cursor, to_python)
+        lookup = descending and "lt" or "gt"
+        queryset = queryset.filter(
+            Q(**{"%s__%s" % (field, lookup): value}) |
+            Q(**{field: value, "id__%s" % lookup: id})
+        )
+    rows = list(queryset.values_list(field, "id")[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*rows[-1])
+    return [id for value, id in rows], next_cursor
@@ -0,0 +1,72 @@
+"""
+Per-user job roles.
+
+A user's roles map job ids to the codename of their JobUser permission
+("can_view" or "can_do"). They're loaded with one query and cached on the
+request and in the user's session. The session copy is tagged with a version
+kept in Django's cache for each user, which changes whenever one of the
+user's JobUser rows is saved or deleted.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from models import JobUser
+
+SESSION_KEY = "jobs_roles"
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _get_version_key(user_id):
+    return "jobs_roles_version_%s" % user_id
+
+
+def _get_version(user_id):
+    key = _get_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Use a new version rather than starting over at zero, so session
+        # copies from before the version was evicted aren't trusted.
+        cache.add(key, repr(time.time()), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_roles(request):
+    """
+    Returns a dictionary of the request's user's roles indexed by job id.
+    """
+    roles = getattr(request, "_jobs_roles", None)
+    if roles is not None:
+        return roles
+
+    user = request.user
+    if not user.is_authenticated():
+        roles = {}
+    else:
+        version = _get_version(user.id)
+        cached = request.session.get(SESSION_KEY)
+        if cached and version is not None and cached[0] == version:
+            roles = cached[1]
+        else:
+            roles = dict(JobUser.objects.filter(user=user).values_list("job", "permission__codename"))
+            request.session[SESSION_KEY] = (version, roles)
+    request._jobs_roles = roles
+    return roles
+
+
+def get_role(request, job):
+    """
+    Returns the request's user's role for the job, or None if they have none.
+    Superusers can do everything.
+    """
+    if request.user.is_superuser:
+        return "can_do"
+    return get_roles(request).get(job.id)
+
+
+def invalidate_roles(sender, instance, **kwargs):
+    cache.set(_get_version_key(instance.user_id), repr(time.time()), VERSION_TIMEOUT)
+post_save.connect(invalidate_roles, sender=JobUser, dispatch_uid="jobs_roles")
+post_delete.connect(invalidate_roles, sender=JobUser, dispatch_uid="jobs_roles_delete")
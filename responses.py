@@ -0,0 +1,143 @@
+"""
+The kinds of response an applicant can give to a component part.
+
+Each kind is a ResponseType that renders a response for the applicant page,
+formats it as an application export cell, and may load what its responses
+need for a whole batch at once. Kinds are declared by the app label and model
+of their content type, like the component registry, and looked up by content
+type id through utils.get_content_type. Responses of any other type are
+expected to have a text ``response``.
+"""
+from utils import get_content_type
+
+
+class ResponseType(object):
+    """
+    How to show one kind of response. ``render`` takes a response and returns
+    a dictionary with the ``type`` the applicant template switches on and the
+    ``response`` it shows; ``format`` returns the response's export cell; and
+    ``prefetch``, if given, takes a list of responses and loads what
+    rendering and formatting them needs in bulk.
+    """
+    def __init__(self, render, format, prefetch=None):
+        self.render = render
+        self.format = format
+        self.prefetch = prefetch
+
+
+def render_response(response):
+    return {"type": "normal", "response": response.response}
+
+
+def format_response(response):
+    return response.response.encode("ascii", "ignore")
+
+
+def render_file_response(response):
+    return {"type": "file", "response": response.file.name}
+
+
+def format_file_response(response):
+    return response.file.name
+
+
+def format_boolean_response(response):
+    return response.response
+
+
+def render_work_history_response(response):
+    return {"type": "work_history", "response": response}
+
+
+def format_work_history_response(response):
+    work_history = "Employer: %s, Position: %s, Start Date: %s, End Date: %s, Hours Worked: %s, Position Summary: %s " % (
+        response.employer, response.position_title, response.start_date,
+        response.end_date, response.hours_worked, response.position_summary
+    )
+    return work_history.encode("ascii", "ignore")
+
+
+def prefetch_preferences(responses):
+    """
+    Loads the preferences of placement preference responses with one query
+    and stores them as each response's ``preference_list``.
+    """
+    field = responses[0]._meta.get_field("preferences")
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+    preferences = {}
+    for row in field.rel.through._default_manager.filter(**{
+        "%s__in" % source: [response.id for response in responses]
+    }).select_related(target).order_by("id"):
+        preferences.setdefault(getattr(row, "%s_id" % source), []).append(getattr(row, target))
+    for response in responses:
+        response.preference_list = preferences.get(response.id, [])
+
+
+def _get_preferences(response):
+    preferences = getattr(response, "preference_list", None)
+    if preferences is None:
+        preferences = list(response.preferences.all())
+    return preferences
+
+
+def render_placement_preference_response(response):
+    return {"type": "placement_preference",
+            "response": response,
+            "preferences": _get_preferences(response)}
+
+
+def format_placement_preference_response(response):
+    preference_choices = "Preferences:"
+    for preference in _get_preferences(response):
+        preference_choices = "%s %s" % (preference_choices, preference)
+    preference_choices = "%s Explantion: %s" % (preference_choices, response.explanation)
+    return preference_choices.encode("ascii", "ignore")
+
+
+DEFAULT_RESPONSE_TYPE = ResponseType(render_response, format_response)
+
+# Response types indexed by (app label, model) of their content type.
+RESPONSE_TYPES = {
+    ("wwu_jobs", "fileresponse"): ResponseType(render_file_response, format_file_response),
+    ("wwu_jobs", "booleanresponse"): ResponseType(render_response, format_boolean_response),
+    ("wwu_jobs", "workhistoryresponse"): ResponseType(render_work_history_response,
+                                                      format_work_history_response),
+    ("wwu_jobs", "placementpreferenceresponse"): ResponseType(render_placement_preference_response,
+                                                              format_placement_preference_response,
+                                                              prefetch_preferences),
+}
+
+
+def get_response_type(content_type_id):
+    """
+    Returns the ResponseType for responses of the given content type.
+    """
+    content_type = get_content_type(content_type_id)
+    return RESPONSE_TYPES.get((content_type.app_label, content_type.model), DEFAULT_RESPONSE_TYPE)
+
+
+def prefetch_responses(responses):
+    """
+    Runs the prefetch of each response type for its responses, given as
+    ``(content type id, response)`` pairs.
+    """
+    batches = {}
+    for content_type_id, response in responses:
+        if response is not None:
+            batches.setdefault(content_type_id, []).append(response)
+    for content_type_id, batch in batches.items():
+        prefetch = get_response_type(content_type_id).prefetch
+        if prefetch:
+            prefetch(batch)
+
+
+def render_application_component_part(application_component_part):
+    """
+    Returns the template context for an application component part's
+    response. Parts without a response have the type "none".
+    """
+    content_object = application_component_part.content_object
+    if content_object is None:
+        return {"type": "none"}
+    return get_response_type(application_component_part.content_type_id).render(content_object)
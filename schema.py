@@ -0,0 +1,227 @@
+"""
+Upgrades for existing jobs databases.
+
+syncdb creates the unique constraints declared in models.py for new tables,
+but doesn't alter tables that already exist. ``get_upgrade_sql`` returns the
+statements that add them to existing tables as unique indexes, along with the
+columns added since and the composite indexes Django can't declare (new tables
+get those from the sql directory). ``remove_duplicates`` deletes the
+duplicate rows that would keep the unique indexes from being created,
+``add_missing_admin_statuses`` fills in the admin statuses older applications
+lack, and ``add_missing_progress`` the component progress they lack. See the
+remove_duplicates, upgrade_jobs_schema and add_admin_statuses management
+commands.
+"""
+from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.backends.util import truncate_name
+from django.db.models import Count
+
+from tagging.models import TaggedItem
+
+from wwu_housing.wwu_jobs.models import Interview
+
+from models import (AdminApplication, Application, ApplicationComponentPart,
+                    ApplicationEmail, ApplicationStatus, ComponentProgress,
+                    Job, JobUser, OutboxMessage)
+from summaries import invalidate_user_summaries
+
+# The unique indexes added to existing tables, as (model, field names) pairs.
+UNIQUE_INDEXES = [
+    (ApplicationStatus, ("status",)),
+    (Application, ("applicant", "job")),
+    (ApplicationComponentPart, ("application", "component_part")),
+    (AdminApplication, ("application",)),
+    (JobUser, ("user", "job")),
+]
+
+# Columns added to existing tables, as (model, field name) pairs. They're
+# added as nullable columns.
+COLUMNS = [
+    (Job, "description_html"),
+    (OutboxMessage, "claimed_datetime"),
+]
+
+# Composite indexes, as (model, field names) pairs. These are also in the sql
+# directory so syncdb creates them for new tables.
+INDEXES = [
+    (Job, ("post_datetime", "close_datetime")),
+]
+
+
+def get_upgrade_sql():
+    """
+    Returns a list of the SQL statements that add the new columns and the
+    unique and composite indexes.
+    """
+    qn = connection.ops.quote_name
+    statements = []
+    for model, field_name in COLUMNS:
+        field = model._meta.get_field(field_name)
+        statements.append("ALTER TABLE %s ADD COLUMN %s %s NULL;" % (
+            qn(model._meta.db_table), qn(field.column), field.db_type(connection=connection)
+        ))
+    indexes = ([(model, field_names, True) for model, field_names in UNIQUE_INDEXES] +
+               [(model, field_names, False) for model, field_names in INDEXES])
+    for model, field_names, unique in indexes:
+        table = model._meta.db_table
+        columns = [model._meta.get_field(name).column for name in field_names]
+        name = "%s_%s" % (table, "_".join(columns))
+        if unique:
+            name += "_uniq"
+        statements.append("CREATE %sINDEX %s ON %s (%s);" % (
+            unique and "UNIQUE " or "",
+            qn(truncate_name(name, connection.ops.max_name_length())),
+            qn(table),
+            ", ".join([qn(column) for column in columns])
+        ))
+    return statements
+
+
+def upgrade_schema():
+    """
+    Runs each upgrade statement in its own transaction and returns a list of
+    ``(statement, error)`` pairs, where ``error`` is None if the statement
+    succeeded. A statement fails if its column or index already exists or if
+    duplicate rows remain.
+    """
+    results = []
+    cursor = connection.cursor()
+    for statement in get_upgrade_sql():
+        try:
+            cursor.execute(statement)
+        except Exception, e:
+            transaction.rollback_unless_managed()
+            results.append((statement, e))
+        else:
+            transaction.commit_unless_managed()
+            results.append((statement, None))
+    return results
+
+
+def _get_duplicates(model, field_names):
+    """
+    Returns a list of lists of the ids of rows that have the same values for
+    the fields, each in id order.
+    """
+    groups = model.objects.values(*field_names).annotate(
+        count=Count("id")
+    ).filter(count__gt=1).order_by()
+    duplicates = []
+    for group in groups:
+        del group["count"]
+        duplicates.append(list(model.objects.filter(**group).order_by("id").values_list("id", flat=True)))
+    return duplicates
+
+
+def _merge_statuses(kept_id, duplicate_ids):
+    user_ids = list(AdminApplication.objects.filter(
+        status__in=duplicate_ids
+    ).values_list("application__applicant__user", flat=True))
+    AdminApplication.objects.filter(status__in=duplicate_ids).update(status=kept_id)
+    ApplicationEmail.objects.filter(status__in=duplicate_ids).update(status=kept_id)
+    ApplicationEmail.objects.templates.invalidate()
+    invalidate_user_summaries(user_ids)
+
+
+def _merge_applications(kept_id, duplicate_ids):
+    # Keep everything the applicant did under any of the applications.
+    if Application.objects.filter(id__in=duplicate_ids, is_submitted=True).count():
+        end_datetimes = Application.objects.filter(
+            id__in=duplicate_ids + [kept_id]
+        ).exclude(end_datetime=None).order_by("end_datetime").values_list("end_datetime", flat=True)[:1]
+        Application.objects.filter(id=kept_id).update(
+            is_submitted=True,
+            end_datetime=end_datetimes and end_datetimes[0] or None
+        )
+    for model in (AdminApplication, ApplicationComponentPart, Interview, OutboxMessage):
+        model.objects.filter(application__in=duplicate_ids).update(application=kept_id)
+    content_type = ContentType.objects.get_for_model(Application)
+    Comment.objects.filter(
+        content_type=content_type,
+        object_pk__in=[unicode(id) for id in duplicate_ids]
+    ).update(object_pk=unicode(kept_id))
+    # Each tag can be on an object once, so tags the kept application already
+    # has are deleted rather than moved.
+    tag_ids = set(TaggedItem.objects.filter(content_type=content_type,
+                                            object_id=kept_id).values_list("tag", flat=True))
+    for tagged_item in TaggedItem.objects.filter(content_type=content_type,
+                                                 object_id__in=duplicate_ids):
+        if tagged_item.tag_id in tag_ids:
+            tagged_item.delete()
+        else:
+            tag_ids.add(tagged_item.tag_id)
+            TaggedItem.objects.filter(id=tagged_item.id).update(object_id=kept_id)
+    ComponentProgress.objects.filter(application__in=duplicate_ids).delete()
+    invalidate_user_summaries(Application.objects.filter(id=kept_id).values_list("applicant__user", flat=True))
+
+
+@transaction.commit_on_success
+def remove_duplicates(dry_run=False):
+    """
+    Deletes rows that would break the unique indexes and returns a list of
+    ``(model, kept id, deleted ids)`` tuples.
+
+    Duplicate statuses and applications are merged into the oldest one, with
+    the rows that point to them moved over. For application component parts,
+    admin statuses and job users, the newest row is kept, since it's the one
+    the views have been showing.
+
+    With ``dry_run``, nothing is changed and only the duplicates that exist
+    now are returned; merging applications may turn up more.
+    """
+    steps = [
+        (ApplicationStatus, ("status",), min, _merge_statuses),
+        (Application, ("applicant", "job"), min, _merge_applications),
+        (ApplicationComponentPart, ("application", "component_part"), max, None),
+        (AdminApplication, ("application",), max, None),
+        (JobUser, ("user", "job"), max, None),
+    ]
+    removed = []
+    for model, field_names, choose, merge in steps:
+        for ids in _get_duplicates(model, field_names):
+            kept_id = choose(ids)
+            duplicate_ids = [id for id in ids if id != kept_id]
+            removed.append((model, kept_id, duplicate_ids))
+            if dry_run:
+                continue
+            if merge:
+                merge(kept_id, duplicate_ids)
+            for instance in model.objects.filter(id__in=duplicate_ids):
+                instance.delete()
+
+    if not dry_run:
+        application_ids = set()
+        for model, kept_id, duplicate_ids in removed:
+            if model is Application:
+                application_ids.add(kept_id)
+            elif model is ApplicationComponentPart:
+                application_ids.update(ApplicationComponentPart.objects.filter(
+                    id=kept_id
+                ).values_list("application", flat=True))
+        if application_ids:
+            ComponentProgress.objects.rebuild(Application.objects.filter(id__in=application_ids))
+    return removed
+
+
+@transaction.commit_on_success
+def add_missing_admin_statuses():
+    """
+    Gives every started application without an admin status its initial
+    one, so the admin page can filter and sort it, and returns the number
+    created. New applications get theirs when they're started.
+    """
+    return AdminApplication.objects.create_missing(
+        Application.objects.filter(applicationcomponentpart__isnull=False).distinct()
+    )
+
+
+@transaction.commit_on_success
+def add_missing_progress():
+    """
+    Creates the component progress of applications started before progress
+    was kept, without which they show as incomplete and can't be submitted,
+    and returns the number of rows created.
+    """
+    return ComponentProgress.objects.add_missing()
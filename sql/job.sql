@@ -0,0 +1 @@
+CREATE INDEX jobs_job_post_datetime_close_datetime ON jobs_job (post_datetime, close_datetime);
@@ -0,0 +1,120 @@
+"""
+Per-user summaries of the jobs a user has applied for.
+
+A summary is loaded with a fixed number of queries no matter how many jobs or
+applications the user has. Summaries are cached for JOBS_INDEX_CACHE_TIMEOUT
+seconds when that setting is set, and a user's cached summary is deleted
+whenever one of the rows it was built from (applications, admin statuses and
+interviews) is saved or deleted. models imports this module so the receivers
+are always connected; bulk updates of those rows call
+``invalidate_user_summaries`` themselves.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import get_model
+from django.db.models.signals import class_prepared, post_delete, post_save
+
+from models import AdminApplication, Applicant, Application
+
+
+def _get_cache_key(user_id):
+    return "jobs_index_summary_%s" % user_id
+
+
+def _load_job_summaries(user):
+    # models imports this module, so wwu_jobs' models (which import those)
+    # may not be loaded yet when it's imported.
+    from wwu_housing.wwu_jobs.models import Interview
+
+    summaries = {}
+
+    def get_summary(job_id):
+        return summaries.setdefault(job_id, {"applications": []})
+
+    applications = list(Application.objects.filter(applicant__user=user))
+    if applications:
+        statuses = dict(
+            (admin_application.application_id, admin_application)
+            for admin_application in AdminApplication.objects.filter(
+                application__in=applications
+            ).select_related("status")
+        )
+        interviews = dict(
+            ((interview.job_id, interview.application_id), interview)
+            for interview in Interview.objects.filter(application__in=applications)
+        )
+        for application in applications:
+            get_summary(application.job_id)["applications"].append((
+                application,
+                statuses.get(application.id),
+                interviews.get((application.job_id, application.id)),
+            ))
+
+    return summaries
+
+
+def get_job_summaries(user):
+    """
+    Returns a dictionary indexed by job id of a list of ``(application,
+    admin_application, interview)`` tuples for the user's applications to the
+    job (``"applications"``), where the last two may be None. The user's
+    roles are in ``permissions.get_roles``.
+    """
+    timeout = getattr(settings, "JOBS_INDEX_CACHE_TIMEOUT", None)
+    if not timeout:
+        return _load_job_summaries(user)
+
+    key = _get_cache_key(user.id)
+    summaries = cache.get(key)
+    if summaries is None:
+        summaries = _load_job_summaries(user)
+        cache.set(key, summaries, timeout)
+    return summaries
+
+
+def invalidate_job_summaries(sender, instance, **kwargs):
+    """
+    Deletes the cached summary of the user a saved or deleted row belongs to.
+    """
+    if not getattr(settings, "JOBS_INDEX_CACHE_TIMEOUT", None):
+        return
+
+    if sender is Application:
+        user_ids = Applicant.objects.filter(
+            id=instance.applicant_id
+        ).values_list("user", flat=True)
+    else:
+        user_ids = Application.objects.filter(
+            id=instance.application_id
+        ).values_list("applicant__user", flat=True)
+    invalidate_user_summaries(user_ids)
+
+
+def invalidate_user_summaries(user_ids):
+    """
+    Deletes the cached summaries of the given users. Bulk updates, which
+    don't send signals, call this themselves.
+    """
+    for user_id in user_ids:
+        cache.delete(_get_cache_key(user_id))
+
+
+def _connect(model):
+    post_save.connect(invalidate_job_summaries, sender=model,
+                      dispatch_uid="jobs_summaries_%s" % model.__name__)
+    post_delete.connect(invalidate_job_summaries, sender=model,
+                        dispatch_uid="jobs_summaries_delete_%s" % model.__name__)
+
+for model in (AdminApplication, Application):
+    _connect(model)
+
+
+def _connect_interview(sender, **kwargs):
+    if sender._meta.app_label == "wwu_jobs" and sender._meta.object_name == "Interview":
+        _connect(sender)
+
+# Connect Interview now if it's loaded, or else once it is.
+class_prepared.connect(_connect_interview)
+interview_model = get_model("wwu_jobs", "interview", seed_cache=False)
+if interview_model:
+    _connect(interview_model)
@@ -1,6 +1,6 @@
 from django import template
 
-from wwu_housing.jobs.utils import get_application_component_status
+from wwu_housing.jobs.utils import get_application_progress
 
 register = template.Library()
 
@@ -9,14 +9,14 @@ def status(application, component):
     """
     Usage: {% status application component %}
 
-    Returns the status of the particular component.
+    Returns the status of the particular component. The application's progress
+    is loaded once and shared by every component rendered for it.
     """
-    is_complete, activity_date = get_application_component_status(application, component)
+    progress = get_application_progress(application).get_progress(component)
 
-    if (is_complete and all(is_complete) or True in is_complete and not component.is_required):
-        return "<strong>Completed</strong> on %s" % activity_date.strftime("%A, %B %e at %I:%M %p")
-    elif True in is_complete:
-        return "<strong>Started</strong>, last modified on %s" % activity_date.strftime("%A, %B %e at %I:%M %p")
+    if progress.completed_count and (progress.is_complete() or not component.is_required):
+        return "<strong>Completed</strong> on %s" % progress.activity_date.strftime("%A, %B %e at %I:%M %p")
+    elif progress.completed_count:
+        return "<strong>Started</strong>, last modified on %s" % progress.activity_date.strftime("%A, %B %e at %I:%M %p")
     else:
         return u"&mdash;"
-
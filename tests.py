@@ -1,17 +1,32 @@
 from __future__ import with_statement
 import datetime
-from django import test
+from django import forms, test
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail.backends import locmem
 from django.template.defaultfilters import slugify
+from django.utils import simplejson
 from django.core.urlresolvers import reverse
+from django.http import HttpRequest
 import httplib
+import smtplib
 
 from wwu_housing.tests import BaseTestCase
-from wwu_housing.jobs import ComponentRegistry
+from wwu_housing.jobs import ComponentRegistry, LocalCache, registry as jobs_registry
 
-from models import Applicant, Application, Component, ComponentPart, Job
-from utils import assign_reviewers
+from benchmarks import CONSTANT_QUERY_VIEWS, QueryCounter, build_job, get_view_paths, measure
+import instrumentation
+from constraints import AttributeNotEqual, Capacity, Exclude, ReviewersPerApplicant, numpy
+from models import AdminApplication, Applicant, Application, ApplicationComponentPart, ApplicationEmail, ApplicationStatus, Component, ComponentPart, ComponentProgress, Job, JobUser, OutboxMessage
+from outbox import drain_outbox, send_outbox_messages
+from permissions import get_roles
+from responses import DEFAULT_RESPONSE_TYPE, RESPONSE_TYPES, get_response_type
+from schema import add_missing_admin_statuses, add_missing_progress
+from utils import ApplicationProgress, TTLCache, _persons, assign_reviewers, prefetch_content_objects
 
 
 # class MockApplicant(object):
@@ -95,6 +110,102 @@ from utils import assign_reviewers
 #                         reviewers_by_applicant)
 
 
+class GreedyAssignReviewersTestCase(test.TestCase):
+    """
+    Tests for the deterministic reviewer assignment strategy.
+    """
+    def setUp(self):
+        self.reviewers = ["Nick", "Brian"]
+        self.get_reviewer_key = lambda r: r
+        self.capacity_rule = lambda r, a, c: len(c) < 1
+
+    def test_no_rules(self):
+        applicants = ["John", "Firass", "Sam"]
+        assignments = assign_reviewers(self.reviewers, applicants,
+                                       get_reviewer_key=self.get_reviewer_key,
+                                       strategy="greedy")
+        self.assertFalse("_UNASSIGNED" in assignments)
+        # Confirm applicants are spread over the least loaded reviewers.
+        self.assertEqual([1, 2], sorted(len(assignments[r]) for r in self.reviewers))
+
+    def test_moves_assigned_applicants(self):
+        """
+        John can be reviewed by either reviewer but Firass only by Nick, so
+        John has to move to Brian to make room for Firass.
+        """
+        only_nick = lambda r, a, c: a != "Firass" or r == "Nick"
+        assignments = assign_reviewers(self.reviewers, ["John", "Firass"],
+                                       get_reviewer_key=self.get_reviewer_key,
+                                       rules=[self.capacity_rule, only_nick],
+                                       strategy="greedy")
+        self.assertEqual({"Nick": ["Firass"], "Brian": ["John"]}, assignments)
+
+    def test_infeasible(self):
+        applicants = ["John", "Firass", "Sam"]
+        assignments = assign_reviewers(self.reviewers, applicants,
+                                       get_reviewer_key=self.get_reviewer_key,
+                                       rules=[self.capacity_rule],
+                                       strategy="greedy")
+        self.assertEqual(1, len(assignments["_UNASSIGNED"]))
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, assign_reviewers, self.reviewers, [],
+                          get_reviewer_key=self.get_reviewer_key,
+                          strategy="fastest")
+
+
+class ConstraintsTestCase(test.TestCase):
+    """
+    Tests for declarative reviewer assignment constraints.
+    """
+    def setUp(self):
+        self.reviewers = [("Nick", "Edens"), ("Brian", "Nash")]
+        self.applicants = [("John", "Edens"), ("Firass", "Nash"), ("Sam", "Mathes")]
+        self.get_reviewer_key = lambda r: r[0]
+        self.rules = [
+            Capacity(2),
+            AttributeNotEqual(lambda r: r[1], lambda a: a[1]),
+            Exclude(lambda a: a[0] == "Sam" and [self.reviewers[0]] or []),
+        ]
+
+    def assertAssignments(self, assignments):
+        self.assertFalse("_UNASSIGNED" in assignments)
+        self.assertEqual([("Firass", "Nash")], assignments["Nick"])
+        self.assertEqual(set([("John", "Edens"), ("Sam", "Mathes")]), set(assignments["Brian"]))
+
+    def test_greedy(self):
+        self.assertAssignments(assign_reviewers(self.reviewers, self.applicants,
+                                                rules=self.rules,
+                                                get_reviewer_key=self.get_reviewer_key,
+                                                strategy="greedy"))
+
+    def test_vectorized(self):
+        if numpy is None:
+            return
+        self.assertAssignments(assign_reviewers(self.reviewers, self.applicants,
+                                                rules=self.rules,
+                                                get_reviewer_key=self.get_reviewer_key,
+                                                strategy="vectorized"))
+
+    def test_reviewers_per_applicant(self):
+        rules = [ReviewersPerApplicant(2)]
+        for strategy in ("greedy", "vectorized"):
+            if strategy == "vectorized" and numpy is None:
+                continue
+            assignments = assign_reviewers(self.reviewers, self.applicants,
+                                           rules=rules,
+                                           get_reviewer_key=self.get_reviewer_key,
+                                           strategy=strategy)
+            self.assertEqual(self.applicants, sorted(assignments["Nick"], key=self.applicants.index))
+            self.assertEqual(self.applicants, sorted(assignments["Brian"], key=self.applicants.index))
+
+    def test_vectorized_rejects_functions(self):
+        self.assertRaises(TypeError, assign_reviewers, self.reviewers, self.applicants,
+                          rules=[lambda r, a, c: True],
+                          get_reviewer_key=self.get_reviewer_key,
+                          strategy="vectorized")
+
+
 class FakeClass(object):
     pass
 
@@ -144,6 +255,49 @@ class ComponentRegistryTestCase(test.TestCase):
         )
 
 
+class TTLCacheTestCase(test.TestCase):
+    """
+    Tests for the cache of person objects.
+    """
+    def test_get(self):
+        cache = TTLCache(10, 60)
+        cache.set("key", "value")
+        self.assertEqual("value", cache.get("key"))
+        self.assertEqual(None, cache.get("missing"))
+
+    def test_timeout(self):
+        cache = TTLCache(10, -1)
+        cache.set("key", "value")
+        self.assertEqual(None, cache.get("key"))
+
+    def test_least_recently_used(self):
+        cache = TTLCache(2, 60)
+        cache.set("one", 1)
+        cache.set("two", 2)
+        # Use "one" so "two" is the least recently used.
+        cache.get("one")
+        cache.set("three", 3)
+        self.assertEqual(1, cache.get("one"))
+        self.assertEqual(None, cache.get("two"))
+        self.assertEqual(3, cache.get("three"))
+
+
+class InstrumentationTestCase(test.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(instrumentation.fingerprint("SELECT 1 WHERE id IN (%s, %s)"),
+                         instrumentation.fingerprint("SELECT 1 WHERE id IN (%s, %s, %s)"))
+
+    def test_duplicates(self):
+        recording = instrumentation.start()
+        recording.add_query("SELECT 1 WHERE id = %s", 0.1)
+        recording.add_query("SELECT 1 WHERE id = %s", 0.1)
+        recording.add_query("SELECT 2", 0.1)
+        instrumentation.timed("smtp", lambda: None)
+        self.assertEqual(recording, instrumentation.stop())
+        self.assertEqual([(2, "SELECT 1 WHERE id = %s")], recording.get_duplicates())
+        self.assertEqual(set(["orm", "smtp"]), set(recording.seconds))
+
+
 class JobTestCase(BaseTestCase):
     fixtures = ["jobs.json"]
 
@@ -263,6 +417,21 @@ class JobTestCase(BaseTestCase):
         job = JobTestCase.create_opened_job(self.job)
         self.assertFalse(job.will_open())
 
+    def test_posted_jobs(self):
+        # Confirm an unpublished job isn't posted.
+        job = JobTestCase.create_unpublished_job(self.job)
+        self.assertEqual([], Job.objects.posted_jobs())
+        self.assertRaises(Job.DoesNotExist, Job.objects.get_posted, job.slug)
+
+        # Confirm the posted jobs are reloaded once the job is posted.
+        self.assertEqual([job], Job.objects.posted_jobs(job.post_datetime))
+
+        # Confirm saving the job reloads the posted jobs.
+        job = JobTestCase.create_published_job(job)
+        self.assertEqual([job], Job.objects.posted_jobs())
+        self.assertEqual(job, Job.objects.get_posted(job.slug))
+        self.assertEqual([], Job.objects.posted_jobs(job.close_datetime))
+
     def test_unpublished_job(self):
         # Create an unpublished job.
         self.job = JobTestCase.create_unpublished_job(self.job)
@@ -505,6 +674,104 @@ class ApplicationTestCase(BaseTestCase):
         pass
 
 
+class ApplicationStatusTestCase(BaseTestCase):
+    fixtures = ["jobs.json", "users.json"]
+
+    def setUp(self):
+        super(ApplicationStatusTestCase, self).setUp()
+        self.job = Job.objects.all()[0]
+        self.applicant = Applicant.objects.create(user=User.objects.all()[0])
+        self.application = Application.objects.create(
+            job=self.job,
+            applicant=self.applicant
+        )
+        self.in_progress = ApplicationStatus.objects.create(status=u"In Progress")
+        self.reviewing = ApplicationStatus.objects.create(status=u"Reviewing")
+
+    def test_get_by_status(self):
+        self.assertEqual(self.reviewing, ApplicationStatus.objects.get_by_status(u"Reviewing"))
+
+        # Confirm the registry is reloaded after a status is renamed.
+        self.reviewing.status = u"Under Review"
+        self.reviewing.save()
+        self.assertRaises(
+            ApplicationStatus.DoesNotExist,
+            ApplicationStatus.objects.get_by_status,
+            u"Reviewing"
+        )
+        self.assertEqual(self.reviewing, ApplicationStatus.objects.get_by_status(u"Under Review"))
+
+        # Confirm callers get copies they can change without changing the
+        # registry.
+        status = ApplicationStatus.objects.get_cached(self.reviewing.id)
+        status.status = u"Changed"
+        self.assertEqual(u"Under Review", ApplicationStatus.objects.get_cached(self.reviewing.id).status)
+
+    def test_local_cache_interval(self):
+        local_cache = LocalCache("test_interval", interval=60)
+        local_cache.validate()
+        local_cache["value"] = 1
+
+        # Confirm another process's invalidation is only noticed once the
+        # interval has passed.
+        cache.set(local_cache.key, local_cache.generation + 1)
+        local_cache.validate()
+        self.assertEqual(1, local_cache.get("value"))
+        local_cache.checked = 0
+        local_cache.validate()
+        self.assertEqual(None, local_cache.get("value"))
+
+    def test_with_status(self):
+        # Confirm an application without an admin status falls back to its
+        # progress.
+        application = Application.objects.with_status().get(id=self.application.id)
+        self.assertEqual(None, application.admin_status_id)
+        self.assertEqual(self.in_progress, application.status)
+
+        # Confirm the admin status is used once there is one.
+        AdminApplication.objects.create(application=self.application, status=self.reviewing)
+        application = Application.objects.with_status().get(id=self.application.id)
+        self.assertEqual(self.reviewing.id, application.admin_status_id)
+        self.assertEqual(self.reviewing, application.status)
+        self.assertEqual(self.reviewing, self.application.status)
+
+
+class PermissionsTestCase(BaseTestCase):
+    fixtures = ["jobs.json", "users.json"]
+
+    def get_request(self, session):
+        request = HttpRequest()
+        request.user = self.user
+        request.session = session
+        return request
+
+    def test_get_roles(self):
+        self.user = User.objects.all()[0]
+        job = Job.objects.all()[0]
+        session = {}
+        self.assertEqual({}, get_roles(self.get_request(session)))
+
+        # Confirm the roles are reloaded once the user gets a role.
+        JobUser.objects.create(user=self.user, job=job,
+                               permission=Permission.objects.get(codename="can_do"))
+        self.assertEqual({job.id: "can_do"}, get_roles(self.get_request(session)))
+
+    def test_viewer_cannot_post(self):
+        user = User.objects.all()[0]
+        user.set_password("test0r")
+        user.save()
+        job = Job.objects.all()[0]
+        JobUser.objects.create(user=user, job=job,
+                               permission=Permission.objects.get(codename="can_view"))
+
+        # Confirm viewers can see the admin page but not save status changes.
+        path = reverse("jobs_job_admin", args=[job.slug])
+        with self.login(user.username, "test0r"):
+            self.assertEqual(httplib.OK, self.client.get(path).status_code)
+            self.assertEqual(httplib.FORBIDDEN, self.client.post(path, {}).status_code)
+            self.assertEqual(httplib.FORBIDDEN, self.client.post(path, {"delta": "1"}).status_code)
+
+
 class ComponentTestCase(BaseTestCase):
     fixtures = ["jobs.json", "users.json"]
 
@@ -613,3 +880,418 @@ class ComponentTestCase(BaseTestCase):
             self.component.componentpart_set.count(),
             self.application.applicationcomponentpart_set.count()
         )
+
+    def test_application_progress(self):
+        component_part = ComponentPart.objects.create(
+            component=self.component,
+            sequence_number=1
+        )
+
+        # Confirm a part without a response is incomplete.
+        progress = ApplicationProgress(self.application)
+        self.assertEqual(([False], None), progress.get_status(self.component))
+        self.assertFalse(progress.is_complete(self.component))
+
+        # Respond to the part (any model instance will do as a response).
+        application_component_part = ApplicationComponentPart.objects.create(
+            application=self.application,
+            component_part=component_part,
+            content_object=self.component
+        )
+
+        # Confirm the part is complete and the activity date is the response's.
+        progress = ApplicationProgress(self.application)
+        self.assertEqual(
+            ([True], application_component_part.activity_date),
+            progress.get_status(self.component)
+        )
+        self.assertTrue(progress.is_complete(self.component))
+
+        # Confirm adding a part makes the component incomplete again.
+        ComponentPart.objects.create(component=self.component, sequence_number=2)
+        progress = ApplicationProgress(self.application)
+        self.assertEqual(([True, False], application_component_part.activity_date),
+                         progress.get_status(self.component))
+
+        # Confirm deleting the response is reflected, and that rebuilding the
+        # progress gives the same result.
+        application_component_part.delete()
+        progress = ComponentProgress.objects.get(application=self.application,
+                                                 component=self.component)
+        self.assertEqual((0, 2), (progress.completed_count, progress.part_count))
+        self.assertEqual(0, ComponentProgress.objects.rebuild(
+            Application.objects.filter(id=self.application.id)
+        ))
+
+    def test_add_missing_progress(self):
+        component_part = ComponentPart.objects.create(
+            component=self.component,
+            sequence_number=1
+        )
+        ApplicationComponentPart.objects.create(
+            application=self.application,
+            component_part=component_part,
+            content_object=self.component
+        )
+
+        # Confirm progress lost (as on installs that predate it) is recreated,
+        # and that progress that's there is left alone.
+        ComponentProgress.objects.all().delete()
+        self.assertEqual(1, add_missing_progress())
+        self.assertTrue(ApplicationProgress(self.application).is_complete(self.component))
+        self.assertEqual(0, add_missing_progress())
+
+    def test_prefetch_content_objects(self):
+        component_parts = [
+            ComponentPart.objects.create(
+                component=self.component,
+                sequence_number=sequence_number,
+                content_object=self.component
+            )
+            for sequence_number in (1, 2)
+        ]
+        component_parts.append(ComponentPart.objects.create(
+            component=self.component,
+            sequence_number=3
+        ))
+
+        # Confirm each part gets its content object, or None when it has none.
+        component_parts = prefetch_content_objects(
+            ComponentPart.objects.filter(id__in=[part.id for part in component_parts]).order_by("sequence_number")
+        )
+        self.assertEqual([self.component, self.component, None],
+                         [part.content_object for part in component_parts])
+
+    def test_response_types(self):
+        # Confirm responses are looked up by content type id, and that types
+        # without a registered kind get the default.
+        file_content_type = ContentType.objects.get(app_label="wwu_jobs", model="fileresponse")
+        self.assertEqual(RESPONSE_TYPES[("wwu_jobs", "fileresponse")],
+                         get_response_type(file_content_type.id))
+        self.assertEqual(DEFAULT_RESPONSE_TYPE,
+                         get_response_type(ContentType.objects.get_for_model(Component).id))
+
+    def test_form_plan(self):
+        # Register a form that takes files for component parts whose content
+        # objects are components.
+        class FileForm(forms.Form):
+            file = forms.FileField()
+        content_type = ContentType.objects.get_for_model(Component)
+        registry = ComponentRegistry()
+        registry.register(content_type.app_label, content_type.model, FileForm)
+        component_part = ComponentPart.objects.create(
+            component=self.component,
+            sequence_number=1,
+            content_object=self.component
+        )
+
+        plan = registry.get_form_plan(self.component)
+        self.assertEqual([component_part], [part.component_part for part in plan.parts])
+        self.assertEqual(FileForm, plan.parts[0].form_class)
+        self.assertTrue(plan.is_multipart)
+
+        # Confirm cached plans are thrown away when a part is saved.
+        jobs_registry.plans[self.component.id] = plan
+        component_part.save()
+        self.assertFalse(self.component.id in jobs_registry.plans)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """
+    Fails to send ``failures`` times after sending the first ``successes``
+    times, and counts how many times its connection was opened.
+    """
+    def __init__(self, failures=0, successes=0, *args, **kwargs):
+        super(FlakyEmailBackend, self).__init__(*args, **kwargs)
+        self.failures = failures
+        self.successes = successes
+        self.opened = 0
+        self.is_open = False
+
+    def open(self):
+        if not self.is_open:
+            self.is_open = True
+            self.opened += 1
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        if self.successes:
+            self.successes -= 1
+        elif self.failures:
+            self.failures -= 1
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return super(FlakyEmailBackend, self).send_messages(messages)
+
+
+class OutboxTestCase(BaseTestCase):
+    fixtures = ["jobs.json", "users.json"]
+
+    def setUp(self):
+        super(OutboxTestCase, self).setUp()
+        self.job = Job.objects.all()[0]
+        self.user = User.objects.all()[0]
+        self.applicant = Applicant.objects.create(user=self.user)
+        self.application = Application.objects.create(
+            job=self.job,
+            applicant=self.applicant
+        )
+
+    def test_drain_outbox(self):
+        # Queue a message.
+        message = OutboxMessage.objects.create(
+            application=self.application,
+            subject="Interview Offered",
+            body="Hello",
+            from_email="jobs@example.com",
+            to="applicant@example.com",
+            comment="Interview Offered email has been sent"
+        )
+
+        # Confirm draining the outbox sends it and posts its comment.
+        result = drain_outbox()
+        self.assertEqual(1, result["sent"])
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(["applicant@example.com"], mail.outbox[0].to)
+        message = OutboxMessage.objects.get(id=message.id)
+        self.assertTrue(message.sent_datetime)
+
+        # Confirm a sent message isn't sent again.
+        self.assertEqual(0, drain_outbox()["sent"])
+        self.assertEqual(1, len(mail.outbox))
+
+    def test_send_outbox_messages(self):
+        admins = settings.ADMINS
+        settings.ADMINS = (("Admin", "admin@example.com"),)
+        try:
+            messages = [OutboxMessage.objects.create(application=self.application,
+                                                     subject="Interview Offered %d" % index,
+                                                     body="Hello",
+                                                     from_email="jobs@example.com",
+                                                     to="applicant@example.com",
+                                                     notify_admins=index == 0)
+                        for index in xrange(3)]
+
+            # Confirm a failed send is retried on a reopened connection, the
+            # other messages share it, and the admins' copy goes with its
+            # message.
+            connection = FlakyEmailBackend(failures=1)
+            result = send_outbox_messages(messages, connection=connection, delay=0)
+        finally:
+            settings.ADMINS = admins
+        self.assertEqual(3, result["sent"])
+        self.assertEqual([(message.id, None) for message in messages], result["outcomes"])
+        self.assertEqual(2, connection.opened)
+        self.assertEqual(4, len(mail.outbox))
+        self.assertEqual(["admin@example.com"], mail.outbox[0].to)
+        self.assertEqual(1, OutboxMessage.objects.get(id=messages[0].id).attempts)
+
+        # Confirm a message that keeps failing records its error.
+        message = OutboxMessage.objects.create(application=self.application,
+                                               subject="Interview Offered",
+                                               body="Hello",
+                                               from_email="jobs@example.com",
+                                               to="applicant@example.com")
+        result = send_outbox_messages([message], connection=FlakyEmailBackend(failures=5), delay=0)
+        self.assertEqual(1, result["failed"])
+        message = OutboxMessage.objects.get(id=message.id)
+        self.assertEqual(None, message.sent_datetime)
+        self.assertEqual(1, message.attempts)
+        self.assertTrue(message.error)
+
+    def test_claims(self):
+        message = OutboxMessage.objects.create(application=self.application,
+                                               subject="Interview Offered",
+                                               body="Hello",
+                                               from_email="jobs@example.com",
+                                               to="applicant@example.com")
+        other_copy = OutboxMessage.objects.get(id=message.id)
+
+        # Confirm a message claimed by another sender isn't drained.
+        OutboxMessage.objects.filter(id=message.id).update(claimed_datetime=datetime.datetime.now())
+        self.assertEqual(0, drain_outbox()["sent"])
+        OutboxMessage.objects.filter(id=message.id).update(claimed_datetime=None)
+
+        # Confirm two senders holding the same message only send it once.
+        self.assertEqual(1, send_outbox_messages([message])["sent"])
+        self.assertEqual(0, send_outbox_messages([other_copy])["sent"])
+        self.assertEqual(1, len(mail.outbox))
+        message = OutboxMessage.objects.get(id=message.id)
+        self.assertEqual(1, message.attempts)
+        self.assertEqual(None, message.claimed_datetime)
+
+    def test_admins_copy_sent_once(self):
+        admins = settings.ADMINS
+        settings.ADMINS = (("Admin", "admin@example.com"),)
+        try:
+            message = OutboxMessage.objects.create(application=self.application,
+                                                   subject="No email",
+                                                   body="Hello",
+                                                   from_email="jobs@example.com",
+                                                   to="jobs@example.com",
+                                                   notify_admins=True)
+
+            # Confirm only the failed copy is retried, and that the admins'
+            # copy isn't sent again once it has gone out.
+            connection = FlakyEmailBackend(failures=3, successes=1)
+            result = send_outbox_messages([message], connection=connection, delay=0)
+            self.assertEqual(1, result["failed"])
+            self.assertEqual(1, len(mail.outbox))
+            self.assertEqual(["admin@example.com"], mail.outbox[0].to)
+            message = OutboxMessage.objects.get(id=message.id)
+            self.assertFalse(message.notify_admins)
+
+            send_outbox_messages([message], connection=FlakyEmailBackend(), delay=0)
+            self.assertEqual(2, len(mail.outbox))
+            self.assertEqual(["jobs@example.com"], mail.outbox[1].to)
+        finally:
+            settings.ADMINS = admins
+
+    def test_application_email_templates(self):
+        status, created = ApplicationStatus.objects.get_or_create(status=u"Interview Offered")
+        email = ApplicationEmail(name="Interview", content="Hello $nmae", job=self.job,
+                                 sender="jobs@example.com", status=status,
+                                 subject="Interview Offered")
+
+        # Confirm unknown and invalid placeholders are caught when saving.
+        self.assertRaises(ValidationError, email.clean)
+        email.content = "Hello $"
+        self.assertRaises(ValidationError, email.clean)
+        email.content = "Hello $name"
+        email.clean()
+        email.save()
+
+        # Confirm the parsed email is loaded once and then cached.
+        counter = QueryCounter()
+        with counter:
+            template = ApplicationEmail.objects.get_template(self.job.id, status.id)
+            ApplicationEmail.objects.get_template(self.job.id, status.id)
+        self.assertEqual(1, len(counter))
+        self.assertEqual(u"Hello Pat", template.template.substitute(name=u"Pat"))
+
+        # Confirm saving the email replaces the cached one.
+        email.subject = "Interview"
+        email.save()
+        self.assertEqual("Interview", ApplicationEmail.objects.get_template(self.job.id, status.id).subject)
+        email.delete()
+        self.assertEqual(None, ApplicationEmail.objects.get_template(self.job.id, status.id))
+
+
+class QueryBudgetTestCase(BaseTestCase):
+    fixtures = ["jobs.json", "users.json"]
+
+    def setUp(self):
+        super(QueryBudgetTestCase, self).setUp()
+        User.objects.create_superuser("benchmark-admin", "benchmark@example.com", "test0r")
+        self.client.login(username="benchmark-admin", password="test0r")
+
+    def tearDown(self):
+        # Don't leave the synthetic persons for other tests.
+        _persons.clear()
+        super(QueryBudgetTestCase, self).tearDown()
+
+    def test_constant_queries(self):
+        # Build a small and a large job with the same components.
+        template = Job.objects.all()[0]
+        small = build_job(template, components=2, parts=2, applicants=2, prefix="small")
+        large = build_job(template, components=2, parts=2, applicants=6, prefix="large")
+
+        # Confirm the views run the same number of queries for both.
+        small_paths = dict(get_view_paths(small, "small-0"))
+        large_paths = dict(get_view_paths(large, "large-0"))
+        for name, budget in CONSTANT_QUERY_VIEWS.items():
+            small_result = measure(self.client, small_paths[name])
+            large_result = measure(self.client, large_paths[name])
+            self.assertEqual(httplib.OK, small_result["status_code"], name)
+            self.assertEqual(small_result["queries"], large_result["queries"], name)
+            self.assertTrue(large_result["queries"] <= budget,
+                            "%s ran %d queries (budget %d)" % (name, large_result["queries"], budget))
+
+
+class AdminPageTestCase(BaseTestCase):
+    fixtures = ["jobs.json", "users.json"]
+
+    def setUp(self):
+        super(AdminPageTestCase, self).setUp()
+        User.objects.create_superuser("paging-admin", "paging@example.com", "test0r")
+        self.client.login(username="paging-admin", password="test0r")
+        self.job = build_job(Job.objects.all()[0], components=1, parts=1, applicants=5, prefix="paging")
+        self.path = reverse("jobs_job_admin", args=[self.job.slug])
+        self.page_size = getattr(settings, "JOBS_ADMIN_PAGE_SIZE", 50)
+        settings.JOBS_ADMIN_PAGE_SIZE = 2
+
+    def tearDown(self):
+        settings.JOBS_ADMIN_PAGE_SIZE = self.page_size
+        _persons.clear()
+        super(AdminPageTestCase, self).tearDown()
+
+    def test_paging(self):
+        # Confirm following the next page links lists every applicant once,
+        # in order.
+        usernames = []
+        path = self.path + "?sort=last_name"
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(httplib.OK, response.status_code)
+            self.assertTrue(len(response.context["apps"]) <= 2)
+            usernames.extend([app["username"] for app in response.context["apps"]])
+            path = response.context["next_page"] and self.path + response.context["next_page"]
+        self.assertEqual(["paging-%d" % index for index in xrange(5)], usernames)
+
+        # Confirm the descending sort reverses the order.
+        response = self.client.get(self.path + "?sort=-last_name")
+        self.assertEqual(["paging-4", "paging-3"],
+                         [app["username"] for app in response.context["apps"]])
+
+    def test_status_filter(self):
+        submitted, created = ApplicationStatus.objects.get_or_create(status=u"Submitted")
+        application = Application.objects.get(job=self.job, applicant__user__username="paging-3")
+        AdminApplication.objects.filter(application=application).update(status=submitted)
+
+        response = self.client.get(self.path + "?status=%d" % submitted.id)
+        self.assertEqual(1, response.context["count"])
+        self.assertEqual(["paging-3"], [app["username"] for app in response.context["apps"]])
+        self.assertEqual(None, response.context["next_page"])
+
+    def test_missing_admin_status(self):
+        AdminApplication.objects.filter(application__applicant__user__username="paging-2").delete()
+
+        # Confirm the page doesn't create admin statuses and still lists the
+        # application when sorting by name.
+        path = self.path + "?sort=last_name"
+        usernames = []
+        while path:
+            response = self.client.get(path)
+            usernames.extend([app["username"] for app in response.context["apps"]])
+            path = response.context["next_page"] and self.path + response.context["next_page"]
+        self.assertTrue("paging-2" in usernames)
+        self.assertEqual(4, AdminApplication.objects.filter(application__job=self.job).count())
+
+        # Confirm the backfill gives it its initial status.
+        self.assertEqual(1, add_missing_admin_statuses())
+        self.assertEqual(5, AdminApplication.objects.filter(application__job=self.job).count())
+
+    def test_delta_submission(self):
+        submitted, created = ApplicationStatus.objects.get_or_create(status=u"Submitted")
+        application = Application.objects.get(job=self.job, applicant__user__username="paging-1")
+        unchanged = Application.objects.get(job=self.job, applicant__user__username="paging-2")
+        data = {"delta": "1",
+                "%d-status" % application.id: submitted.id,
+                "%d-status" % unchanged.id: unchanged.status.id}
+
+        # Confirm only the changed row is updated and returned.
+        response = self.client.post(self.path, data, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(httplib.OK, response.status_code)
+        self.assertEqual([{"application": application.id, "status": submitted.id,
+                           "status_name": u"Submitted"}], simplejson.loads(response.content))
+        self.assertEqual(submitted, AdminApplication.objects.get(application=application).status)
+
+        # Confirm posting the same statuses again changes nothing.
+        response = self.client.post(self.path, data, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual([], simplejson.loads(response.content))
+
+        # Confirm an unknown status is rejected.
+        data["%d-status" % application.id] = 0
+        response = self.client.post(self.path, data)
+        self.assertEqual(400, response.status_code)
@@ -4,12 +4,13 @@ from django.views.generic.list_detail import object_list
 from wwu_housing.wwu_jobs.views import interview, positionplacement , interview_creation
 from wwu_housing.desk_attendant.views  import admin_individual, admin_list, apply
 from models import Job
-from views import admin, applicant, application, component, create_admin_csv, export_application, job, jobs_index
+from views import admin, applicant, application, component, create_admin_csv, export_application, instrumentation_stats, job, jobs_index
 
 
 urlpatterns = patterns("",
 #url(r"^$", object_list, {"queryset": Job.objects.posted(), "template_object_name": "job"}, name="jobs_index"),
     url(r"^$", jobs_index, name="jobs_index"),
+    url(r"^instrumentation/$", instrumentation_stats, name="jobs_instrumentation"),
     url(r"^(?P<job_slug>[-\w]+)/$", job, name="jobs_job"),
     url(r"^(?P<job_slug>[-\w]+)/interview/$", interview, name="jobs_interview"),
     url(r"^(?P<job_slug>[-\w]+)/interview_creation/$", interview_creation, name="jobs_interview_creation"),
@@ -1,40 +1,276 @@
+import heapq
+import itertools
 import random
+import threading
+import time
 
-from sqlalchemy import or_
+from sqlalchemy.orm import eagerload, object_session
 
+from django.conf import settings
+from django.contrib.contenttypes import generic
+from django.contrib.contenttypes.models import ContentType
 
 from wwu_housing.data import Person
 from wwu_housing.library.validator import validate_id
 
-from models import ApplicationComponentPart
+import instrumentation
+from constraints import Constraint, ReviewersPerApplicant, assign_vectorized
+from models import ComponentPart, ComponentProgress
+
+
+class ApplicationProgress(object):
+    """
+    Completion progress for every component of an application.
+
+    The application's ComponentProgress rows are loaded with a single query
+    the first time progress is asked for.
+    """
+    def __init__(self, application):
+        self.application = application
+        self._progress = None
+
+    def get_progress(self, component):
+        """
+        Returns the application's ComponentProgress for the component. If the
+        application hasn't responded to the component, an unsaved one with no
+        completed parts is returned; its ``part_count`` is None until
+        ``is_complete`` needs it.
+        """
+        if self._progress is None:
+            self._progress = dict(
+                (progress.component_id, progress)
+                for progress in ComponentProgress.objects.filter(application=self.application)
+            )
+        progress = self._progress.get(component.id)
+        if progress is None:
+            progress = ComponentProgress(application=self.application, component=component,
+                                         part_count=None)
+            self._progress[component.id] = progress
+        return progress
+
+    def _get_part_count(self, component, progress):
+        if progress.part_count is None:
+            progress.part_count = ComponentPart.objects.filter(component=component).count()
+        return progress.part_count
+
+    def get_status(self, component):
+        """
+        Returns a tuple of a list of booleans, one for each of the component's
+        parts, saying whether the part has a response (completed parts first),
+        and the latest activity date of the completed parts.
+        """
+        progress = self.get_progress(component)
+        part_count = self._get_part_count(component, progress)
+        is_complete = [True] * progress.completed_count
+        is_complete += [False] * (part_count - progress.completed_count)
+        return (is_complete, progress.activity_date)
+
+    def is_complete(self, component):
+        """Returns whether every part of the component has a response."""
+        progress = self.get_progress(component)
+        self._get_part_count(component, progress)
+        return progress.is_complete()
+
+
+def get_application_progress(application):
+    """
+    Returns the ApplicationProgress for the application, creating it the first
+    time it's asked for so that every caller in a request shares its queries.
+    """
+    progress = getattr(application, "_progress_cache", None)
+    if progress is None:
+        progress = ApplicationProgress(application)
+        application._progress_cache = progress
+    return progress
 
 
 def get_application_component_status(application, component):
-    is_complete = []
-    activity_date = None
-    for component_part in component.componentpart_set.all():
+    return get_application_progress(application).get_status(component)
+
+
+# Content types by id. Content types only change when models are added, so the
+# whole table is loaded the first time an unknown id is asked for.
+_content_types = {}
+
+
+def get_content_type(id):
+    """
+    Returns the content type with the given id from a table of every content
+    type that's loaded with one query.
+    """
+    content_type = _content_types.get(id)
+    if content_type is None:
+        _content_types.clear()
+        _content_types.update((content_type.id, content_type)
+                              for content_type in ContentType.objects.all())
         try:
-            application_component_part = application.applicationcomponentpart_set.get(
-                component_part=component_part
-            )
+            content_type = _content_types[id]
+        except KeyError:
+            raise ContentType.DoesNotExist("No content type with id %s." % id)
+    return content_type
+
+
+def load_content_objects(keys):
+    """
+    Returns a dictionary of the objects for the given (content type id, object
+    id) pairs, indexed by pair, loading each content type with one query.
+    """
+    object_ids = {}
+    for content_type_id, object_id in keys:
+        if content_type_id is not None and object_id is not None:
+            object_ids.setdefault(content_type_id, set()).add(object_id)
+
+    content_objects = {}
+    for content_type_id, ids in object_ids.items():
+        model = get_content_type(content_type_id).model_class()
+        for object_id, content_object in model._default_manager.in_bulk(list(ids)).items():
+            content_objects[(content_type_id, object_id)] = content_object
+    return content_objects
+
+
+def _get_generic_foreign_keys(model):
+    return [field for field in model._meta.virtual_fields
+            if isinstance(field, generic.GenericForeignKey)]
+
+
+def _get_content_object_key(instance, field):
+    content_type_field = instance._meta.get_field(field.ct_field)
+    return (getattr(instance, content_type_field.attname), getattr(instance, field.fk_field))
+
+
+def prefetch_content_objects(instances):
+    """
+    Loads the generic foreign key objects (e.g. ``content_object``) of a
+    queryset or list of model instances with one query per content type, and
+    caches each object on its instance so reading it doesn't query the
+    database. Returns the instances as a list.
+
+    Instances whose object no longer exists get None.
+    """
+    instances = list(instances)
+    fields = {}
+    keys = []
+    for instance in instances:
+        if instance.__class__ not in fields:
+            fields[instance.__class__] = _get_generic_foreign_keys(instance.__class__)
+        for field in fields[instance.__class__]:
+            keys.append(_get_content_object_key(instance, field))
+
+    content_objects = load_content_objects(keys)
+    for instance in instances:
+        for field in fields[instance.__class__]:
+            setattr(instance, field.cache_attr,
+                    content_objects.get(_get_content_object_key(instance, field)))
+    return instances
+
+
+def _passes(rules, reviewer, applicant, current_applicants):
+    for rule in rules:
+        if not rule(reviewer, applicant, current_applicants):
+            return False
+    return True
+
+
+def _assign_randomly(reviewers, applicants, rules, get_reviewer_key, count_max):
+    assignments = {}
+
+    for applicant in applicants:
+        count = 0
+        while count < count_max:
+            reviewer = random.choice(reviewers)
+
+            # Get current applicants for this reviewer.
+            key = get_reviewer_key(reviewer)
+            if key not in assignments:
+                assignments[key] = []
+            current_applicants = assignments[key]
+
+            rule_results = [rule(reviewer, applicant, current_applicants)
+                            for rule in rules]
+            if all(rule_results):
+                assignments[key].append(applicant)
+                break
+            else:
+                count += 1
+                if count == count_max:
+                    if "_UNASSIGNED" not in assignments:
+                        assignments["_UNASSIGNED"] = [applicant]
+                    else:
+                        assignments["_UNASSIGNED"].append(applicant)
+
+    return assignments
+
+
+def _assign_greedily(reviewers, applicants, rules, get_reviewer_key):
+    keys = [get_reviewer_key(reviewer) for reviewer in reviewers]
+    current = [[] for reviewer in reviewers]
+
+    # Heap of (load, index) entries. Entries go stale when a reviewer's load
+    # changes and are skipped when popped.
+    heap = [(0, index) for index in xrange(len(reviewers))]
 
-            if application_component_part.content_object:
-                is_complete.append(True)
+    def by_load():
+        return sorted(xrange(len(reviewers)), key=lambda index: len(current[index]))
 
-                if not activity_date:
-                    activity_date = application_component_part.activity_date
-                elif application_component_part.activity_date > activity_date:
-                    activity_date = application_component_part.activity_date
+    def augment(applicant, visited):
+        # Place the applicant with an unvisited reviewer, moving one of that
+        # reviewer's applicants to another reviewer if it has to.
+        for index in by_load():
+            if index not in visited and _passes(rules, reviewers[index], applicant, current[index]):
+                visited.add(index)
+                current[index].append(applicant)
+                return True
+        for index in by_load():
+            if index in visited:
+                continue
+            assigned_applicants = current[index]
+            positions = [position for position in xrange(len(assigned_applicants))
+                         if _passes(rules, reviewers[index], applicant,
+                                    assigned_applicants[:position] + assigned_applicants[position + 1:])]
+            if not positions:
+                continue
+            visited.add(index)
+            for position in positions:
+                other = assigned_applicants.pop(position)
+                if augment(other, visited):
+                    assigned_applicants.append(applicant)
+                    return True
+                assigned_applicants.insert(position, other)
+        return False
+
+    unassigned = []
+    for applicant in applicants:
+        rejected = []
+        assigned = False
+        while heap:
+            load, index = heapq.heappop(heap)
+            if load != len(current[index]):
+                continue
+            if _passes(rules, reviewers[index], applicant, current[index]):
+                current[index].append(applicant)
+                heapq.heappush(heap, (len(current[index]), index))
+                assigned = True
+                break
+            rejected.append((load, index))
+        for entry in rejected:
+            heapq.heappush(heap, entry)
+
+        if not assigned:
+            if augment(applicant, set()):
+                # Loads changed along the augmenting path, so rebuild the heap.
+                heap = [(len(current[index]), index) for index in xrange(len(reviewers))]
+                heapq.heapify(heap)
             else:
-                is_complete.append(False)
-        except ApplicationComponentPart.DoesNotExist:
-            is_complete.append(False)
+                unassigned.append(applicant)
 
-    return (is_complete, activity_date)
+    assignments = dict(zip(keys, current))
+    if unassigned:
+        assignments["_UNASSIGNED"] = unassigned
+    return assignments
 
 
 def assign_reviewers(reviewers, applicants, rules=None,
-                     get_reviewer_key=None, count_max=20):
+                     get_reviewer_key=None, count_max=20, strategy="random"):
     """
     Assign applicants to each reviewer so that all the ``rules`` pass.
 
@@ -62,7 +298,22 @@ def assign_reviewers(reviewers, applicants, rules=None,
     so that it returned a string of the reviewer's name.
 
     ``count_max`` = The maximum number of pass throughs to attempt assigning an
-    applicant to a reviewer before moving on.
+    applicant to a reviewer before moving on. Only used by the "random"
+    strategy.
+
+    ``strategy`` = How to choose reviewers. "random" tries randomly chosen
+    reviewers up to ``count_max`` times per applicant. "greedy" is
+    deterministic: it tries reviewers from least to most loaded and, if none
+    of them accepts the applicant, moves already assigned applicants to other
+    reviewers to make room (an augmenting path search, as in bipartite
+    matching). When the rules are capacity limits and per-pair eligibility
+    checks, "greedy" leaves an applicant unassigned only if no valid
+    assignment exists. "vectorized" does the same as "greedy" with NumPy
+    arrays, but only accepts rules from ``jobs.constraints``.
+
+    Rules can be ``jobs.constraints`` instances as well as functions. With a
+    ``ReviewersPerApplicant`` constraint each applicant is assigned that many
+    times, to different reviewers.
     """
     rules = rules or []
     if not get_reviewer_key:
@@ -71,58 +322,172 @@ Must pass a function to the keyword argument "get_reviewer_key" that returns an
 immutable data structure (such as a string) to index reviewers by in the
 resulting dictionary. You passed: %s
 """ % str(get_reviewer_key))
-    assignments = {}
 
-    for applicant in applicants:
-        count = 0
-        while count < count_max:
-            reviewer = random.choice(reviewers)
+    if strategy == "vectorized":
+        if not all(isinstance(rule, Constraint) for rule in rules):
+            raise TypeError("The vectorized strategy only accepts rules from jobs.constraints.")
+        return assign_vectorized(reviewers, applicants, rules, get_reviewer_key)
 
-            # Get current applicants for this reviewer.
-            key = get_reviewer_key(reviewer)
-            if key not in assignments:
-                assignments[key] = []
-            current_applicants = assignments[key]
+    # Give each applicant as many turns as the reviewers they need.
+    count = max([1] + [rule.count for rule in rules
+                       if isinstance(rule, ReviewersPerApplicant)])
+    applicants = list(applicants) * count
 
-            rule_results = [rule(reviewer, applicant, current_applicants)
-                            for rule in rules]
-            if all(rule_results):
-                assignments[key].append(applicant)
-                break
-            else:
-                count += 1
-                if count == count_max:
-                    if "_UNASSIGNED" not in assignments:
-                        assignments["_UNASSIGNED"] = [applicant]
-                    else:
-                        assignments["_UNASSIGNED"].append(applicant)
+    if strategy == "random":
+        return _assign_randomly(reviewers, applicants, rules, get_reviewer_key, count_max)
+    elif strategy == "greedy":
+        return _assign_greedily(reviewers, applicants, rules, get_reviewer_key)
+    else:
+        raise ValueError("Unknown reviewer assignment strategy '%s'." % strategy)
 
-    return assignments
 
-def _get_persons_for_job(job):
-    # load person objects for all job applicants
-    usernames = []
+class TTLCache(object):
+    """
+    A least recently used cache of at most ``size`` entries, each of which
+    expires ``timeout`` seconds after it's stored.
+    """
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._entries = {}
+        self._clock = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, last_used, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return default
+            self._entries[key] = (expires, self._clock.next(), value)
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            if key not in self._entries and len(self._entries) >= self.size:
+                self._evict()
+            self._entries[key] = (time.time() + self.timeout, self._clock.next(), value)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        # Drop expired entries and, if that isn't enough, the least recently
+        # used tenth of the cache so eviction doesn't happen on every set.
+        now = time.time()
+        for key, (expires, last_used, value) in self._entries.items():
+            if expires < now:
+                del self._entries[key]
+        if len(self._entries) >= self.size:
+            by_last_use = sorted(self._entries.items(), key=lambda item: item[1][1])
+            for key, entry in by_last_use[:max(1, self.size / 10)]:
+                del self._entries[key]
+
+
+# Student records don't change during a review session, so person objects are
+# kept for a few minutes to save reloading them on every admin page. They're
+# shared across requests and threads, so they're detached from the session
+# that loaded them (see _detach).
+_persons = TTLCache(getattr(settings, "JOBS_PERSON_CACHE_SIZE", 5000),
+                    getattr(settings, "JOBS_PERSON_CACHE_TIMEOUT", 600))
+
+# The most values to put in one IN clause (Oracle allows 1000).
+PERSON_CHUNK_SIZE = 500
+
+
+def _chunks(values, size):
+    for index in xrange(0, len(values), size):
+        yield values[index:index + size]
+
+
+def get_persons(identifiers):
+    """
+    Returns a dictionary of person objects for the given usernames and student
+    ids, indexed by username or student id.
+
+    Persons are looked up in a per-process cache first and the rest are loaded
+    (with their addresses) using IN queries of at most PERSON_CHUNK_SIZE
+    values.
+    """
+    persons = {}
     student_ids = []
-    for application in job.application_set.all():
-        if not application.applicationcomponentpart_set.all():
-            continue
-        if validate_id(application.applicant.user.username):
-            student_ids.append(application.applicant.user.username)
+    usernames = []
+    for identifier in set(identifiers):
+        person = _persons.get(identifier)
+        if person is not None:
+            persons[identifier] = person
+        elif validate_id(identifier):
+            student_ids.append(identifier)
         else:
-            usernames.append(application.applicant.user.username)
+            usernames.append(identifier)
+
     if student_ids or usernames:
-        student_ids_or = [Person.student_id == student_id for student_id in student_ids]
-        usernames_or = [Person.pidm == Person.pidm_from_username(username) for username in usernames]
-        ids_or = student_ids_or + usernames_or
-        persons = Person.query.filter(or_(*ids_or))
-        object_dict = {}
-        for person in persons:
-            if person.username:
-                object_dict[person.username] = person
-            else:
-                object_dict[person.student_id] = person
+        instrumentation.timed("sqlalchemy", _load_persons, student_ids, usernames, persons)
+    return persons
 
-        return object_dict
-    else:
-        return None
 
+def _detach(person):
+    """
+    Removes a loaded person and its addresses from their session, so the
+    cached objects never expire, lazy load or touch a session another thread
+    is using. Only what was loaded with the person (its columns and its
+    eagerly loaded addresses) can be read afterwards.
+    """
+    session = object_session(person)
+    if session is None:
+        return
+    addresses = list(person.addresses)
+    session.expunge(person)
+    for address in addresses:
+        # Depending on the relation's cascade, expunging the person may
+        # already have removed its addresses.
+        if object_session(address) is session:
+            session.expunge(address)
+
+
+def _load_persons(student_ids, usernames, persons):
+    query = Person.query.options(eagerload("addresses"))
+    for chunk in _chunks(student_ids, PERSON_CHUNK_SIZE):
+        for person in list(query.filter(Person.student_id.in_(chunk))):
+            _detach(person)
+            persons[person.student_id] = person
+            _persons.set(person.student_id, person)
+
+    # Usernames without a student record have no pidm.
+    pidms = [pidm for pidm in [Person.pidm_from_username(username) for username in usernames]
+             if pidm is not None]
+    for chunk in _chunks(pidms, PERSON_CHUNK_SIZE):
+        for person in list(query.filter(Person.pidm.in_(chunk))):
+            _detach(person)
+            persons[person.username] = person
+            _persons.set(person.username, person)
+
+
+def _get_persons_for_applications(applications):
+    """
+    Loads person objects for the applicants of the given applications, keyed
+    by the applicant's username (which is a student id for some applicants).
+    """
+    return get_persons([application.applicant.user.username
+                        for application in applications])
+
+
+def _get_persons_for_job(job):
+    # load person objects for all job applicants
+    applications = job.application_set.filter(
+        applicationcomponentpart__isnull=False
+    ).distinct().select_related("applicant__user")
+    return _get_persons_for_applications(applications) or None
@@ -1,20 +1,22 @@
-import csv
+import copy
 import datetime
 import os
+import re
 
-from string import Template
 from sqlalchemy import or_
 
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.sites.models import Site
 from django.db import connection, transaction
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, HttpResponseRedirect)
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
-from django.core.mail import EmailMessage, mail_admins
+from django.utils import simplejson
+from django.utils.http import urlencode
 from django.core.urlresolvers import reverse
 from django.conf import settings
 
@@ -26,17 +28,30 @@ from wwu_housing.wwu_jobs.models import Interview
 from wwu_housing.data import Person
 
 from forms import AdminApplicationForm
-from models import AdminApplication, Applicant, Application, ApplicationComponentPart, ApplicationEmail, ApplicationStatus, Component, Job, JobUser, User
+from models import AdminApplication, Applicant, Application, ApplicationComponentPart, ApplicationStatus, Component, ComponentProgress, Job, User
 
-from utils import get_application_component_status, _get_persons_for_job
+import instrumentation
+from decorators import job_role_required
+from exports import admin_csv_rows, application_export_rows, csv_response
+from outbox import apply_status_changes, apply_status_deltas, send_queued
+from paging import get_page
+from permissions import get_roles
+from responses import prefetch_responses, render_application_component_part
+from summaries import get_job_summaries
+from utils import get_application_progress, prefetch_content_objects, _get_persons_for_applications
 
 
 def job(request, job_slug):
-    job = get_object_or_404(Job.objects.all(), slug=job_slug)
+    now = datetime.datetime.now()
+    try:
+        job = Job.objects.get_posted(job_slug, now)
+    except Job.DoesNotExist:
+        # Jobs that aren't posted can still be viewed by their URL.
+        job = get_object_or_404(Job.objects.all(), slug=job_slug)
     applied = False
     job_open = True
     status = "In progress"
-    if job.close_datetime > datetime.datetime.now() > job.post_datetime:
+    if job.is_posted(now):
         if request.user.is_authenticated():
             application_exists = Application.objects.filter(
                                 job=job,
@@ -52,9 +67,9 @@ def job(request, job_slug):
                     except AdminApplication.DoesNotExist:
                             status = "Application Submitted"
 
-    if job.deadline < datetime.datetime.now():
+    if job.deadline < now:
         job_open = False
-    elif job.open_datetime > datetime.datetime.now():
+    elif job.will_open(now):
         job_open = False
 
     context = {"job": job,
@@ -65,292 +80,278 @@ def job(request, job_slug):
 
 
 def jobs_index(request):
-    context = {}
-    jobs = Job.objects.all()
+    now = datetime.datetime.now()
     job_list = []
-    applications = []
-
+    summaries = {}
     if request.user.is_authenticated():
-        user = request.user
-        applicant = Applicant.objects.filter(user=user)
-        applications = Application.objects.filter(applicant=applicant)
-    administrator = None
-    for eachjob in jobs:
-        if eachjob.close_datetime > datetime.datetime.now() and eachjob.post_datetime <= datetime.datetime.now():
-            job = {}
-            #Check if they are an admin or not
-            try:
-                administrator = JobUser.objects.get(user=request.user, job=eachjob)
-            except (JobUser.DoesNotExist, TypeError):
-                administrator = None
-
-            # if user has a job app for a job whose deadline date has not
-            # passed include it.
-            for application in applications:
-
-                if application.job == eachjob:
-                    #if the application is submitted obtain status
-                    if application.is_submitted:
-                        job["job"] = eachjob
-                        job["applied"] = True
-                        job["admin"] = administrator
-                        #TODO: change so submitted app's don't show up if unaccessable
-                        # using the closedate
-                        try:
-                            application_status = AdminApplication.objects.get(
-                                                            application=application)
-                            job["app_status"] = application_status.status
-                            if application_status.status.status in [u"Interview Scheduled", u"Interview Offered"]:
-                                job["interview_status"] = application_status.status.status
-                                try:
-                                    interview = Interview.objects.get(job=application.job,
-                                                                application=application)
-                                    job["interview_date"] = interview.datetime
-                                except Interview.DoesNotExist:
-                                    job["interview_date"] = None
-                            job_list.append(job)
-                        except AdminApplication.DoesNotExist:
-                            job["app_status"] = "You have successfully submitted your application"
-                            job_list.append(job)
-                    # If the user has started an application for this job and the job deadline has
-                    # not passed include it with "In Progress" Status
-                    elif eachjob.deadline > datetime.datetime.now():
-                        job["job"] = eachjob
-                        job["applied"] = True
-                        job["admin"] = administrator
-                        job["app_status"] = "In Progress"
-                        job_list.append(job)
-            # Include job's that are still open regardless of application status
-            # or if job deadline has passed and job closedate has not and user is admin
-            if not job:
-                if (eachjob.deadline > datetime.datetime.now()) or administrator:
-                    job["job"] = eachjob
-                    job["applied"] = None
-                    job["admin"] = administrator
-                    job_list.append(job)
+        summaries = get_job_summaries(request.user)
+    roles = get_roles(request)
+
+    for eachjob in Job.objects.posted_jobs(now):
+        job = {}
+        summary = summaries.get(eachjob.id, {})
+        #Check if they are an admin or not
+        administrator = roles.get(eachjob.id)
+
+        # if user has a job app for a job whose deadline date has not
+        # passed include it.
+        for application, application_status, interview in summary.get("applications", []):
+            #if the application is submitted obtain status
+            if application.is_submitted:
+                job["job"] = eachjob
+                job["applied"] = True
+                job["admin"] = administrator
+                #TODO: change so submitted app's don't show up if unaccessable
+                # using the closedate
+                if application_status:
+                    job["app_status"] = application_status.status
+                    if application_status.status.status in [u"Interview Scheduled", u"Interview Offered"]:
+                        job["interview_status"] = application_status.status.status
+                        if interview:
+                            job["interview_date"] = interview.datetime
+                        else:
+                            job["interview_date"] = None
+                else:
+                    job["app_status"] = "You have successfully submitted your application"
+                job_list.append(job)
+            # If the user has started an application for this job and the job deadline has
+            # not passed include it with "In Progress" Status
+            elif eachjob.deadline > now:
+                job["job"] = eachjob
+                job["applied"] = True
+                job["admin"] = administrator
+                job["app_status"] = "In Progress"
+                job_list.append(job)
+        # Include job's that are still open regardless of application status
+        # or if job deadline has passed and job closedate has not and user is admin
+        if not job:
+            if (eachjob.deadline > now) or administrator:
+                job["job"] = eachjob
+                job["applied"] = None
+                job["admin"] = administrator
+                job_list.append(job)
 
     context = {"job_list" : job_list,
                "user" : request.user}
     return render_to_response("jobs/index.html", context, context_instance=RequestContext(request))
 
-@login_required
-def create_admin_csv(request, job_slug):
-    job = get_object_or_404(Job.objects.all(), slug=job_slug)
+@job_role_required
+def create_admin_csv(request, job, role):
+    return csv_response(admin_csv_rows(job), "%s.csv" % job.slug)
+
+
+# Columns the admin applicant table can be sorted by, with the field to order
+# the applications by and the type of its values.
+ADMIN_SORTS = {
+    "status": ("adminapplication__status", int),
+    "last_name": ("applicant__user__last_name", unicode),
+}
+
+# Hall addresses are shown on the admin page; any other address is shown as
+# off campus.
+HALLS = ["Birnam", "Ridgeway", "Buchanan", "Edens", "Fairhaven", "Higginson", "Highland", "Mathes", "Nash"]
+
+
+def _get_comments(application_ids):
+    """
+    Returns a dictionary of lists of the public comments on the applications,
+    indexed by application id.
+    """
+    comments = {}
+    for comment in Comment.objects.filter(
+        content_type=ContentType.objects.get_for_model(Application),
+        object_pk__in=[unicode(id) for id in application_ids],
+        site__pk=settings.SITE_ID,
+        is_public=True,
+        is_removed=False
+    ).select_related("user").order_by("submit_date"):
+        comments.setdefault(int(comment.object_pk), []).append(comment)
+    return comments
+
+
+def _get_address(person):
+    address = ""
+    for person_address in person.addresses:
+        if person_address.street_line_1.partition(" ")[0] in HALLS:
+            address = person_address.street_line_1
+    return address or "Off campus"
+
+
+# Status fields of the admin page's forms, which are prefixed with the
+# application's id.
+STATUS_FIELD = re.compile(r"^(\d+)-status$")
+
+
+def _save_status_deltas(request, job):
+    """
+    Saves a delta submission of the admin page, which posts the status fields
+    of only the applications whose status changed. AJAX requests get the
+    updated rows back as JSON; others are redirected back to the page.
+    """
+    statuses = {}
+    for key, value in request.POST.items():
+        match = STATUS_FIELD.match(key)
+        if match:
+            try:
+                statuses[int(match.group(1))] = int(value)
+            except ValueError:
+                return HttpResponseBadRequest("Invalid status: %s" % value, mimetype="text/plain")
     try:
-        administrator = JobUser.objects.get(user=request.user, job=job)
-    except JobUser.DoesNotExist:
-        if not request.user.is_superuser:
-            return HttpResponse(status=401, content="401 Unauthorized Access", mimetype="text/plain")
-
-    response = HttpResponse(mimetype="text/csv")
-    response["Content-Disposition"] = 'attachment; filename=%s.csv' % job_slug
-
-    writer = csv.writer(response)
-    writer.writerow(["Student ID", "First Name", "Last Name", "Gender",
-                     "Email", "Address", "GPA", "Ethnicity", "Status",
-                     "Interview Location", "Interview Date"])
-
-    persons = _get_persons_for_job(job)
-
-    for application in job.application_set.all():
-        if not application.applicationcomponentpart_set.all():
-            continue
-        person = persons[application.applicant.user.username]
-        address = person.get_address_by_type("MA")
-        if address:
-            mailing_address = address.street_line_1
-            if address.street_line_2:
-                mailing_address = mailing_address + " " + address.street_line_2
-            if address.street_line_3:
-                mailing_address = mailing_address + " " + address.street_line_3
-            mailing_address = "%s %s, %s %s" % (mailing_address, address.city,
-                                                address.state, address.zip_code)
-        else:
-            mailing_address = ""
-
-        try:
-            interview = Interview.objects.get(job=application.job,
-                                              application=application)
-            interview_location = interview.location
-            interview_date = interview.datetime.strftime("%A, %B %e at %I:%M %p")
-        except Interview.DoesNotExist:
-            interview_location = "None"
-            interview_date = "None"
-
-        writer.writerow([person.student_id, person.first_name,
-                         person.last_name, person.gender, person.email,
-                         mailing_address, person.gpa, person.ethnicity,
-                         application.status, interview_location,
-                         interview_date])
-
-    return response
-
-
-@login_required
-def admin(request, job_slug):
+        updated = apply_status_deltas(job, statuses, request.user)
+    except ApplicationStatus.DoesNotExist, e:
+        return HttpResponseBadRequest(str(e), mimetype="text/plain")
+    send_queued([message for application, status, message in updated])
+
+    if request.is_ajax():
+        rows = [{"application": application.id, "status": status.id, "status_name": status.status}
+                for application, status, message in updated]
+        return HttpResponse(simplejson.dumps(rows), mimetype="application/json")
+    messages.success(request, "Changes saved successfully")
+    return HttpResponseRedirect(request.get_full_path())
+
+
+@job_role_required
+def admin(request, job, role):
+    if request.method == "POST" and role != "can_do":
+        return HttpResponseForbidden("Only job admins can change statuses.",
+                                     mimetype="text/plain")
+    if request.POST.get("delta"):
+        return _save_status_deltas(request, job)
 
     post_data = request.POST or None
-    job = get_object_or_404(Job.objects.all(), slug=job_slug)
-    try:
-        administrator = JobUser.objects.get(user=request.user, job=job)
-    except JobUser.DoesNotExist:
-        if not request.user.is_superuser:
-            return HttpResponse(content="401 Unauthorized: Access is denied due to invalid credentials.",
-                                mimetype="text/plain", status=401)
-        else:
-            administrator = True
+    applications = job.application_set.filter(applicationcomponentpart__isnull=False).distinct()
 
-    persons = _get_persons_for_job(job)
+    # Filter, sort and page the table in the database.
+    try:
+        status_filter = int(request.GET.get("status", ""))
+    except ValueError:
+        status_filter = None
+    if status_filter:
+        applications = applications.filter(adminapplication__status=status_filter)
+    sort = request.GET.get("sort", "status")
+    if sort.lstrip("-") not in ADMIN_SORTS:
+        sort = "status"
+    field, to_python = ADMIN_SORTS[sort.lstrip("-")]
+    if field == ADMIN_SORTS["status"][0]:
+        # Applications get an admin status when they're started, and
+        # upgrade_jobs_schema adds them for older ones, but rows without one
+        # can't be paged by status.
+        applications = applications.filter(adminapplication__isnull=False)
+    try:
+        application_ids, next_cursor = get_page(
+            applications, field, request.GET.get("after"),
+            getattr(settings, "JOBS_ADMIN_PAGE_SIZE", 50),
+            descending=sort.startswith("-"), to_python=to_python
+        )
+    except ValueError:
+        raise Http404
+
+    # Load only what the rows on this page need, in bulk.
+    page = Application.objects.select_related("applicant__user").in_bulk(application_ids)
+    page = [page[id] for id in application_ids]
+    persons = _get_persons_for_applications(page)
+    instances = dict(
+        (instance.application_id, instance)
+        for instance in AdminApplication.objects.filter(application__in=application_ids).select_related("status")
+    )
+    interviews = dict(
+        (interview.application_id, interview)
+        for interview in Interview.objects.filter(job=job, application__in=application_ids).order_by("id")
+    )
+    comments = _get_comments(application_ids)
+    statuses = ApplicationStatus.objects.get_all()
+    status_choices = [(status.id, status.status) for status in statuses]
 
     apps = []
     forms = []
-    addresses = ["Birnam", "Ridgeway", "Buchanan", "Edens", "Fairhaven", "Higginson", "Highland", "Mathes", "Nash"]
-
-    for application in job.application_set.all():
-        if not application.applicationcomponentpart_set.all():
-            continue
+    status_changes = []
+    for application in page:
         person = persons[application.applicant.user.username]
-        user = application.applicant.user
-        applicant_full = Applicant.objects.get(user=user)
         app = {}
         app['username'] = person.username or person.student_id
         app['first_name'] = person.first_name
         app['last_name'] = person.last_name
         app['gpa'] = person.gpa
         app['is_submitted'] = application.is_submitted
-        try:
-            interview = Interview.objects.get(job=application.job,
-                                              application=application)
+        interview = interviews.get(application.id)
+        if interview:
             app['interview_date'] = interview.datetime.strftime("%B, %e at %I:%M %p")
-        except Interview.DoesNotExist:
-            app['interview_date'] = "None"
-        addy = ""
-        for address in person.addresses:
-            if address.street_line_1.partition(' ')[0] in addresses:
-                addy = address.street_line_1
-        if addy:
-            app["address"] = addy
         else:
-            app["address"] = "Off campus"
-
-#       app["conduct_id"] = has_conduct(person)
-        try:
-            instance = AdminApplication.objects.get(application=application)
-        except AdminApplication.DoesNotExist:
-            if application.is_submitted or application.end_datetime:
-                status = ApplicationStatus.objects.get(status="Submitted")
-            else:
-                status = ApplicationStatus.objects.get(status="In Progress")
-            instance = AdminApplication(status=status, application=application)
-        prefix = "%s" % (application.id)
+            app['interview_date'] = "None"
+        app["address"] = _get_address(person)
+        app["comments"] = comments.get(application.id, [])
+
+        instance = instances.get(application.id)
+        if instance is None:
+            # The application has no admin status yet. Only sorts by other
+            # columns reach here, since sorting by status leaves these out.
+            instance = AdminApplication(application=application,
+                                        status=AdminApplication.objects.get_initial_status(application))
+        instance.application = application
         form = AdminApplicationForm(post_data,
-                                     prefix=prefix,
-                                     instance=instance)
+                                    prefix=str(application.id),
+                                    instance=instance)
+        # Share the status choices so each form doesn't query for them.
+        form.fields["status"].choices = status_choices
         app["form"] = form
         app["application"] = application
-        if administrator and form.is_valid():
-            form.save()
-            if form.initial["status"] != form.cleaned_data["status"].id:
-                if form.cleaned_data["status"].status not in [u'Position Offered', u'Position Accepted']:
-                    try:
-                        application_email = ApplicationEmail.objects.get(status=form.cleaned_data["status"], job=job)
-                    except ApplicationEmail.DoesNotExist:
-                        application_email = None
-                    if not settings.DEBUG:
-                        if application_email and person.email:
-                            subject = application_email.subject
-                            from_email = application_email.sender
-                            to_email = (person.email,)
-
-                            try:
-                                message_content = Template(application_email.content)
-                                message = message_content.substitute(name=person.first_name)
-                            except KeyError, e:
-                                subject = "KeyError in application email"
-                                message = "%s in application email id: %s" % (e.message, application_email.name)
-                                mail_admins(subject, message)
-
-                            email = EmailMessage(subject, message, from_email, to_email)
-                            email.send()
-                            comment = "%s email has been sent" % (form.cleaned_data["status"])
-                            user = request.user or None
-                            content_type = ContentType.objects.get(name="application")
-                            Comment.objects.create(content_type=content_type,
-                                                object_pk=application.id,
-                                                site=Site.objects.get_current(),
-                                                user=user,
-                                                comment=comment)
-
-                        elif application_email:
-                            subject = "%s %s for position %s has no email" % (person.first_name, person.last_name, job)
-                            message = "%s %s (%s) does not have an email address. They applied for %s and were supposed to receive %s email." % (person.first_name, person.last_name, person.student_id, job, application_email.subject)
-                            mail_admins(subject, message)
-                            from_email = application_email.sender
-                            to_email = (application_email.sender, )
-                            email = EmailMessage(subject, message, from_email, to_email)
-                            email.send()
-                            comment = "%s no email could be sent" % (form.cleaned_data["status"])
-                            user = request.user or None
-                            content_type = ContentType.objects.get(name="application")
-                            Comment.objects.create(content_type=content_type,
-                                                    object_pk=application.id,
-                                                    site=Site.objects.get_current(),
-                                                    user=user,
-                                                    comment=comment)
+        if form.is_valid():
+            status_changes.append((form, person))
         apps.append(app)
         forms.append(form)
+    if status_changes:
+        send_queued(apply_status_changes(job, status_changes, request.user))
     if forms and all(form.is_valid() for form in forms):
         messages.success(request, "Changes saved successfully")
-        return HttpResponseRedirect(reverse("jobs_job_admin",
-                                            args=[job_slug]))
-    apps.sort(key=lambda apps: apps["form"].instance.status.id)
-    colors = {"Submitted": "#FF9999",
-              "Reviewing": "#FFFF80",
-              "Interview Offered": "#99D699",
-              "Interview Scheduled": "#99FFFF",
-              "Denied": "white",
-              "Offered": "white"}
+        return HttpResponseRedirect(request.get_full_path())
+
+    query = {"sort": sort}
+    if status_filter:
+        query["status"] = status_filter
+    sort_links = {}
+    for name in ADMIN_SORTS:
+        direction = sort == name and "-" or ""
+        sort_links[name] = "?" + urlencode(dict(query, sort=direction + name))
+    next_page = None
+    if next_cursor:
+        next_page = "?" + urlencode(dict(query, after=next_cursor))
     context = {"apps": apps,
-               "colors": colors,
-               "admin": administrator}
+               "statuses": statuses,
+               "status_filter": status_filter,
+               "sort": sort,
+               "sort_links": sort_links,
+               "first_page": "?" + urlencode(query),
+               "next_page": next_page,
+               "count": applications.count(),
+               "role": role}
 
     return render_to_response("jobs/admin.html", context, context_instance=RequestContext(request))
 
 
-@login_required
-def applicant(request, job_slug, applicant_slug):
-    job = get_object_or_404(Job.objects.all(), slug=job_slug)
-    try:
-        administrator = JobUser.objects.get(user=request.user, job=job)
-    except JobUser.DoesNotExist:
-        if not request.user.is_superuser:
-            return HttpResponse(content="401 Unauthorized: Access is denied due to invalid credentials.",
-                                mimetype="text/plain", status=401)
-
+@job_role_required
+def applicant(request, job, role, applicant_slug):
     # TODO: change applicant_slug to username for clarity
-    user = User.objects.get(username=applicant_slug)
-    applicant = Applicant.objects.get(user=user)
-    application = Application.objects.get(applicant=applicant, job=job)
+    application = Application.objects.select_related("applicant__user").get(
+        applicant__user__username=applicant_slug, job=job
+    )
+    user = application.applicant.user
+
+    # Load the responses with their component parts and components, then the
+    # questions and the response objects with one query per content type.
+    application_component_parts = prefetch_content_objects(
+        application.applicationcomponentpart_set.select_related(
+            "component_part__component"
+        ).order_by("component_part__sequence_number")
+    )
+    prefetch_content_objects(application_component_part.component_part
+                             for application_component_part in application_component_parts)
+    prefetch_responses((application_component_part.content_type_id, application_component_part.content_object)
+                       for application_component_part in application_component_parts)
     components = []
-    for component_part in application.component_parts.all():
-        responses = {}
-        response = application.applicationcomponentpart_set.get(application=application, component_part=component_part)
-        if not response.content_type:
-            responses["type"] = "none"
-        elif response.content_type.name == "file response":
-            responses["response"] = response.content_object.file.name
-            responses["type"] = "file"
-        elif response.content_type.name == "work history response":
-            responses["response"] = response.content_object
-            responses["type"] = "work_history"
-        elif response.content_type.name == "placement preference response":
-            responses["response"] = response.content_object
-            responses["type"] = "placement_preference"
-        else:
-            responses["response"] = response.content_object.response
-            responses["type"] = "normal"
-        responses["component_part"] = component_part
-        responses["component"] = response.component_part.component.name
+    for application_component_part in application_component_parts:
+        responses = render_application_component_part(application_component_part)
+        responses["component_part"] = application_component_part.component_part
+        responses["component"] = application_component_part.component_part.component.name
         components.append(responses)
 
     components.sort(key= lambda responses: responses["component"])
@@ -361,74 +362,9 @@ def applicant(request, job_slug, applicant_slug):
     return render_to_response("jobs/applicant.html", context, context_instance=RequestContext(request))
 
 
-@login_required
-def export_application(request, job_slug):
-    job = get_object_or_404(Job.objects.all(), slug=job_slug)
-    try:
-        administrator = JobUser.objects.get(user=request.user, job=job)
-    except JobUser.DoesNotExist:
-        if not request.user.is_superuser:
-            return HttpResponse(status=401, content="401 Unauthorized Access", mimetype="text/plain")
-
-    response = HttpResponse(mimetype="text/csv")
-    response["Content-Disposition"] = 'attachment; filename=%s_applications.csv' % job_slug
-    writer = csv.writer(response)
-    #create column headers
-    columns = ["Submission Date", "Interview Date"]
-
-    for component in job.component_set.all():
-        for component_part in component.componentpart_set.all():
-            part_name = component_part.content_object.short_name or component_part.content_object.question
-            column_name = "%s: %s" % (component, part_name)
-            columns.append(column_name)
-    writer.writerow(columns)
-
-    # fill the rows with application component part responses
-    for application in job.application_set.all():
-        #only include submitted applications
-        if application.is_submitted:
-            component_responses = []
-            component_responses.append(application.end_datetime.strftime("%m,%d,%y %I:%M"))
-            Interview_date = application.interview_set.all()
-            if Interview_date:
-                component_responses.append(Interview_date[0].datetime.strftime("%m,%d,%y %I:%M"))
-            else:
-                component_responses.append("")
-            application_component_parts = application.component_parts.all().order_by('component', 'sequence_number')
-            for component_part in application_component_parts:
-                component_response = application.applicationcomponentpart_set.get(
-                                                                    application=application,
-                                                                    component_part=component_part
-                                                                    )
-                if not component_response.content_type:
-                    component_responses.append("empty")
-                elif component_response.content_type.name == "file response":
-                    component_responses.append( component_response.content_object.file.name)
-                elif component_response.content_type.name == "boolean response":
-                    component_responses.append( component_response.content_object.response)
-                elif component_response.content_type.name == "work history response":
-                    employer = component_response.content_object.employer
-                    position_title = component_response.content_object.position_title
-                    start_date = component_response.content_object.start_date
-                    end_date = component_response.content_object.end_date
-                    hours_worked = component_response.content_object.hours_worked
-                    position_summary = component_response.content_object.position_summary
-                    work_history = "Employer: %s, Position: %s, Start Date: %s, End Date: %s, Hours Worked: %s, Position Summary: %s " % (employer, position_title, start_date, end_date, hours_worked, position_summary)
-                    component_responses.append(work_history.encode('ascii', 'ignore'))
-                elif component_response.content_type.name == "placement preference response":
-                    preference_responses = component_response.content_object.preferences.all()
-                    preference_choices = "Preferences:"
-                    for preference in preference_responses:
-                        preference_choices  = "%s %s" %(preference_choices, preference)
-                    preference_choices = "%s Explantion: %s" %(preference_choices,
-                                                            component_response.content_object.explanation)
-
-                    component_responses.append(preference_choices.encode('ascii', 'ignore'))
-                else:
-                    component_responses.append( component_response.content_object.response.encode('ascii', 'ignore'))
-            writer.writerow(component_responses)
-
-    return response
+@job_role_required
+def export_application(request, job, role):
+    return csv_response(application_export_rows(job), "%s_applications.csv" % job.slug)
 
 
 @login_required
@@ -468,24 +404,26 @@ def application(request, job_slug):
         job=job
     )
     if created:
-        status = ApplicationStatus.objects.get(status="In Progress")
+        status = ApplicationStatus.objects.get_by_status(u"In Progress")
         AdminApplication.objects.create(application=application, status=status)
 
     # Is the user submitting their application?
     if request.POST and request.POST.has_key(u"submit"):
+        progress = get_application_progress(application)
         can_submit = True
-        for component in job.component_set.all():
-            if component.is_required:
-                is_complete = get_application_component_status(application, component)[0]
-                if not all(is_complete):
-                    can_submit = False
+        for component in job.component_set.filter(is_required=True):
+            if not progress.is_complete(component):
+                can_submit = False
         if can_submit:
             application.is_submitted = True
             application.end_datetime = datetime.datetime.now()
             application.save()
 
-            status = ApplicationStatus.objects.get(status="Submitted")
-            application_status = AdminApplication.objects.get(application=application)
+            status = ApplicationStatus.objects.get_by_status(u"Submitted")
+            application_status, created = AdminApplication.objects.get_or_create(
+                application=application,
+                defaults={"status": status}
+            )
             application_status.status = status
             application_status.save()
 
@@ -510,55 +448,104 @@ def application(request, job_slug):
     )
 
 
+@transaction.commit_on_success
+def _save_component_responses(valid_parts):
+    """
+    Saves the responses of valid component forms in one transaction.
+
+    ``valid_parts`` is a list of ``(form, component_part,
+    application_component_part)`` tuples. Application component parts whose
+    response object didn't change only have their activity dates updated,
+    all with one query.
+    """
+    unchanged_ids = []
+    components = set()
+    for form, component_part, application_component_part in valid_parts:
+        # Save the result of the form's process method as the application
+        # component part's content which will serve as the initial instance
+        # for this form.
+        response = form.process(component_part)
+        if (application_component_part.id and response is not None and
+            application_component_part.content_type_id == ContentType.objects.get_for_model(response).id and
+            application_component_part.object_id == response.pk):
+            unchanged_ids.append(application_component_part.id)
+        else:
+            application_component_part.content_object = response
+            application_component_part.save(refresh_progress=False)
+        components.add((application_component_part.application_id, component_part.component_id))
+
+    if unchanged_ids:
+        ApplicationComponentPart.objects.filter(id__in=unchanged_ids).update(
+            activity_date=datetime.datetime.now()
+        )
+    # Refresh each component's progress once for all its saved parts.
+    for application_id, component_id in components:
+        ComponentProgress.objects.refresh(application_id, component_id)
+
+
 @login_required
 def component(request, job_slug, component_slug):
     try:
-        job = Job.objects.posted().get(slug=job_slug)
+        job = Job.objects.get_posted(job_slug)
     except Job.DoesNotExist:
         return HttpResponseRedirect(reverse("jobs_index"))
 
     applicant = Applicant.objects.get(user=request.user)
     application, created = Application.objects.get_or_create(job=job, applicant=applicant)
+    if created:
+        AdminApplication.objects.create(application=application,
+                                        status=AdminApplication.objects.get_initial_status(application))
     component = get_object_or_404(job.component_set, slug=component_slug)
-    component_parts = component.componentpart_set.all()
+    plan = registry.get_form_plan(component)
+
+    # Copy the planned component parts so this request's forms aren't attached
+    # to the instances shared by every request.
+    planned_component_parts = prefetch_content_objects(
+        copy.copy(planned_part.component_part) for planned_part in plan.parts
+    )
+
+    # Load the application's responses for this component.
+    responses = dict(
+        (application_component_part.component_part_id, application_component_part)
+        for application_component_part in ApplicationComponentPart.objects.filter(
+            application=application,
+            component_part__component=component
+        )
+    )
+    prefetch_content_objects(responses.values())
 
     all_forms_valid = True
-    has_file_field = False
-    for component_part in component_parts:
-        # Try to find the an existing response for this component part for this
-        # application. Otherwise, create an unsaved application component part.
-        try:
-            application_component_part = ApplicationComponentPart.objects.get(
-                application=application,
-                component_part=component_part
-            )
+    has_file_field = plan.is_multipart
+    component_parts = []
+    valid_parts = []
+    for planned_part, component_part in zip(plan.parts, planned_component_parts):
+        # Use the existing response for this component part for this
+        # application if there is one. Otherwise, create an unsaved application
+        # component part.
+        application_component_part = responses.get(component_part.id)
+        if application_component_part:
             instance = application_component_part.content_object
-        except ApplicationComponentPart.DoesNotExist:
+        else:
             application_component_part = ApplicationComponentPart(
                 application=application,
                 component_part=component_part
             )
             instance = None
 
-        content_type = component_part.content_type
-        form_cls = registry.get(content_type.app_label).get(content_type.model)
+        form_cls = planned_part.form_class
         form = form_cls(request.POST or None, request.FILES or None,
                         instance=instance, prefix=component_part.id)
 
-        if not has_file_field and form.is_multipart():
-            has_file_field = True
-
         if form.is_valid() and not application.is_submitted:
-            # Save the result of the form's process method as the application
-            # component part's content which will serve as the initial instance
-            # for this form.
-            response = form.process(component_part)
-            application_component_part.content_object = response
-            application_component_part.save()
+            valid_parts.append((form, component_part, application_component_part))
         else:
             all_forms_valid = False
 
         component_part.form = form
+        component_parts.append(component_part)
+
+    if valid_parts:
+        _save_component_responses(valid_parts)
 
     # Only redirect if all forms validated.
     if all_forms_valid:
@@ -581,4 +568,12 @@ def component(request, job_slug, component_slug):
     )
 
 
+@staff_member_required
+def instrumentation_stats(request):
+    if request.method == "POST":
+        instrumentation.reset_stats()
+        return HttpResponseRedirect(reverse("jobs_instrumentation"))
 
+    context = {"stats": instrumentation.get_stats()[:50],
+               "enabled": getattr(settings, "JOBS_INSTRUMENTATION", False)}
+    return render_to_response("jobs/instrumentation.html", context, context_instance=RequestContext(request))